@@ -0,0 +1,343 @@
+"""
+Benchmarks for parsing, merging and serializing event data
+
+Runs each benchmark against generated corpora at several sizes, and compares
+the results to the saved baseline (benchmarks/baseline.json), so regressions
+are visible
+
+python3 benchmarks/bench.py             # run, compare to baseline
+python3 benchmarks/bench.py --save      # run, and save as the new baseline
+"""
+
+import sys
+import json
+import logging
+import subprocess
+import importlib.util
+import tempfile
+from time import perf_counter
+from pathlib import Path
+from types import ModuleType
+from typing import Callable, Dict, List, Any, Optional, NamedTuple, Sequence
+
+import click
+
+from corpus import CorpusConfig, write_corpus
+
+from mpv_history_daemon import serialize
+from mpv_history_daemon.daemon import SocketData
+from mpv_history_daemon.events import history, _reconstruct_event_stream
+from mpv_history_daemon.merge import merge_files
+
+BASELINE = Path(__file__).parent / "baseline.json"
+
+# if a benchmark is this much slower than the baseline, its marked as a regression
+REGRESSION_THRESHOLD = 1.2
+
+# absolute limits (in seconds) for some benchmarks, exceeding these fails the run
+BUDGETS: Dict[str, float] = {
+    "import cli": 0.15,
+}
+
+
+class Corpus(NamedTuple):
+    scale: int
+    event_files: List[Path]
+    merged_file: Path
+    sessions: Dict[str, Any]
+
+
+Benchmark = Callable[[Corpus], Callable[[], Any]]
+
+BENCHMARKS: Dict[str, Benchmark] = {}
+
+# benchmarks which don't depend on the corpus size, only run once
+UNSCALED: List[str] = []
+
+
+def benchmark(name: str, scaled: bool = True) -> Callable[[Benchmark], Benchmark]:
+    """
+    registers a benchmark. The decorated function receives the corpus
+    and does any setup, returning the function which is timed
+    """
+
+    def _register(func: Benchmark) -> Benchmark:
+        BENCHMARKS[name] = func
+        if not scaled:
+            UNSCALED.append(name)
+        return func
+
+    return _register
+
+
+def _serialize_without_orjson() -> ModuleType:
+    """
+    loads a separate copy of the serialize module, as if orjson wasn't installed
+    """
+    saved = sys.modules.get("orjson")
+    sys.modules["orjson"] = None  # type: ignore[assignment]
+    try:
+        spec = importlib.util.spec_from_file_location(
+            "mpv_history_daemon._serialize_stdlib", serialize.__file__
+        )
+        assert spec is not None and spec.loader is not None
+        mod = importlib.util.module_from_spec(spec)
+        spec.loader.exec_module(mod)
+    finally:
+        if saved is None:
+            del sys.modules["orjson"]
+        else:
+            sys.modules["orjson"] = saved
+    return mod
+
+
+@benchmark("parse_json_file")
+def bench_parse_json_file(corpus: Corpus) -> Callable[[], Any]:
+    return lambda: serialize.parse_json_file(corpus.merged_file)
+
+
+@benchmark("parse_json_file (stdlib)")
+def bench_parse_json_file_stdlib(corpus: Corpus) -> Callable[[], Any]:
+    mod = _serialize_without_orjson()
+    return lambda: mod.parse_json_file(corpus.merged_file)
+
+
+@benchmark("_reconstruct_event_stream")
+def bench_reconstruct(corpus: Corpus) -> Callable[[], Any]:
+    def run() -> None:
+        for name, events in corpus.sessions.items():
+            for _ in _reconstruct_event_stream(
+                events, filename=name, allow_if_playing_for=60
+            ):
+                pass
+
+    return run
+
+
+@benchmark("history")
+def bench_history(corpus: Corpus) -> Callable[[], Any]:
+    return lambda: list(history(corpus.event_files))
+
+
+@benchmark("history (merged)")
+def bench_history_merged(corpus: Corpus) -> Callable[[], Any]:
+    return lambda: list(history([corpus.merged_file], stream=False))
+
+
+@benchmark("history (merged, streamed)")
+def bench_history_merged_streamed(corpus: Corpus) -> Callable[[], Any]:
+    return lambda: list(history([corpus.merged_file], stream=True))
+
+
+@benchmark("history (interned)")
+def bench_history_interned(corpus: Corpus) -> Callable[[], Any]:
+    return lambda: list(history(corpus.event_files, intern=True))
+
+
+@benchmark("merge_files")
+def bench_merge_files(corpus: Corpus) -> Callable[[], Any]:
+    return lambda: merge_files(corpus.event_files, mtime_seconds_since=0)
+
+
+@benchmark("dump_json")
+def bench_dump_json(corpus: Corpus) -> Callable[[], Any]:
+    data = {"mapping": corpus.sessions}
+    return lambda: serialize.dump_json(data)
+
+
+@benchmark("dump_json (stdlib)")
+def bench_dump_json_stdlib(corpus: Corpus) -> Callable[[], Any]:
+    mod = _serialize_without_orjson()
+    data = {"mapping": corpus.sessions}
+    return lambda: mod.dump_json(data)
+
+
+class _AtLevel:
+    """
+    runs a benchmark with the (logzero) logger at some level, nothing is
+    actually emitted, so this measures the cost of building the messages
+    """
+
+    def __init__(self, func: Callable[[], Any], level: int) -> None:
+        self.func = func
+        self.level = level
+
+    def __call__(self) -> Any:
+        from logzero import logger  # type: ignore[import]
+
+        saved = logger.level
+        handlers = logger.handlers
+        logger.setLevel(self.level)
+        logger.handlers = [logging.NullHandler()]
+        try:
+            return self.func()
+        finally:
+            logger.setLevel(saved)
+            logger.handlers = handlers
+
+
+def _replay_nevent(corpus: Corpus) -> Callable[[], Any]:
+    """
+    replays the corpus through SocketData.nevent, without an mpv socket
+    """
+    events = [
+        (name, data)
+        for session in corpus.sessions.values()
+        for event in session.values()
+        for name, data in event.items()
+    ]
+
+    def run() -> None:
+        sd = SocketData.__new__(SocketData)
+        sd.socket_time = "1600000000"
+        sd.events = {}
+        for name, data in events:
+            sd.nevent(name, data)
+
+    return run
+
+
+@benchmark("SocketData.nevent (INFO)")
+def bench_nevent_info(corpus: Corpus) -> Callable[[], Any]:
+    return _AtLevel(_replay_nevent(corpus), logging.INFO)
+
+
+@benchmark("SocketData.nevent (DEBUG)")
+def bench_nevent_debug(corpus: Corpus) -> Callable[[], Any]:
+    return _AtLevel(_replay_nevent(corpus), logging.DEBUG)
+
+
+@benchmark("_reconstruct_event_stream (DEBUG)")
+def bench_reconstruct_debug(corpus: Corpus) -> Callable[[], Any]:
+    return _AtLevel(bench_reconstruct(corpus), logging.DEBUG)
+
+
+def _run_python(code: str) -> None:
+    subprocess.run([sys.executable, "-c", code], check=True)
+
+
+@benchmark("python startup", scaled=False)
+def bench_python_startup(corpus: Corpus) -> Callable[[], Any]:
+    # to compare the import benchmarks against
+    return lambda: _run_python("pass")
+
+
+@benchmark("import cli", scaled=False)
+def bench_import_cli(corpus: Corpus) -> Callable[[], Any]:
+    return lambda: _run_python("import mpv_history_daemon.__main__")
+
+
+@benchmark("parse --help", scaled=False)
+def bench_parse_help(corpus: Corpus) -> Callable[[], Any]:
+    return lambda: subprocess.run(
+        [sys.executable, "-m", "mpv_history_daemon", "parse", "--help"],
+        check=True,
+        stdout=subprocess.DEVNULL,
+    )
+
+
+def make_corpus(tmp: Path, scale: int, base_sessions: int) -> Corpus:
+    cfg = CorpusConfig(sessions=base_sessions * scale)
+    event_files = write_corpus(tmp / f"events-{scale}", cfg)
+    (merged_file,) = write_corpus(tmp / f"merged-{scale}", cfg, merged=cfg.sessions)
+    sessions = serialize.parse_json_file(merged_file)["mapping"]
+    return Corpus(
+        scale=scale,
+        event_files=event_files,
+        merged_file=merged_file,
+        sessions=sessions,
+    )
+
+
+def time_benchmark(func: Callable[[], Any], repeat: int) -> float:
+    """returns the fastest of repeat runs"""
+    best = float("inf")
+    for _ in range(repeat):
+        start = perf_counter()
+        func()
+        best = min(best, perf_counter() - start)
+    return best
+
+
+def _format_row(name: str, scale: int, took: float, base: Optional[float]) -> str:
+    line = f"{name:<30} {str(scale) + 'x':>5} {took * 1000:>12.2f}ms"
+    if base is not None:
+        ratio = took / base
+        line += f" {ratio:>8.2f}x baseline"
+        if ratio > REGRESSION_THRESHOLD:
+            line += "  REGRESSION"
+    if name in BUDGETS and took > BUDGETS[name]:
+        line += f"  OVER BUDGET ({BUDGETS[name] * 1000:.0f}ms)"
+    return line
+
+
+@click.command()
+@click.option(
+    "--scales",
+    default="1,10,100",
+    show_default=True,
+    help="Comma separated corpus sizes, as multiples of --base-sessions",
+)
+@click.option("--base-sessions", type=int, default=20, show_default=True)
+@click.option(
+    "-k",
+    "--only",
+    "only",
+    multiple=True,
+    help="Only run benchmarks whose names contain this",
+)
+@click.option(
+    "--save", is_flag=True, default=False, help="Save the results as the new baseline"
+)
+def main(scales: str, base_sessions: int, only: Sequence[str], save: bool) -> None:
+    """
+    Run the benchmarks, comparing to the saved baseline
+    """
+    baseline: Dict[str, Dict[str, float]] = {}
+    if BASELINE.exists():
+        baseline = json.loads(BASELINE.read_text())["results"]
+    results: Dict[str, Dict[str, float]] = {}
+    over_budget = False
+    with tempfile.TemporaryDirectory() as td:
+        for i, scale in enumerate(map(int, scales.split(","))):
+            corpus = make_corpus(Path(td), scale, base_sessions)
+            repeat = max(1, 5 // scale)
+            for name, bench in BENCHMARKS.items():
+                if only and not any(o in name for o in only):
+                    continue
+                if name in UNSCALED:
+                    if i > 0:
+                        continue
+                    took = time_benchmark(bench(corpus), repeat=5)
+                    scale = 1
+                else:
+                    took = time_benchmark(bench(corpus), repeat=repeat)
+                if name in BUDGETS and took > BUDGETS[name]:
+                    over_budget = True
+                results.setdefault(name, {})[str(scale)] = took
+                click.echo(
+                    _format_row(
+                        name, scale, took, baseline.get(name, {}).get(str(scale))
+                    )
+                )
+    if save:
+        if only and BASELINE.exists():
+            # only update the benchmarks that were run
+            for name, res in results.items():
+                baseline.setdefault(name, {}).update(res)
+            results = baseline
+        BASELINE.write_text(
+            json.dumps(
+                {"base_sessions": base_sessions, "results": results},
+                indent=2,
+                sort_keys=True,
+            )
+            + "\n"
+        )
+        click.echo(f"Saved baseline to {BASELINE}", err=True)
+    if over_budget:
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
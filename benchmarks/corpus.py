@@ -0,0 +1,220 @@
+"""
+Generates a synthetic corpus of event files/merged archives which look
+like what the daemon writes, for benchmarking
+
+python3 benchmarks/corpus.py --sessions 500 ./corpus
+"""
+
+import os
+import random
+from pathlib import Path
+from typing import Dict, Any, List, NamedTuple, Optional
+
+import click
+
+from mpv_history_daemon.serialize import dump_data, DataFormat, FORMAT_EXTENSIONS
+
+
+class CorpusConfig(NamedTuple):
+    # number of mpv instances (i.e. event files)
+    sessions: int = 100
+    # files played per mpv instance are picked uniformly from this range
+    min_playlist: int = 1
+    max_playlist: int = 20
+    # chance of pausing/seeking per item played
+    pause_density: float = 0.2
+    seek_density: float = 0.1
+    # chance an mpv instance is playing a URL instead of local files
+    stream_ratio: float = 0.1
+    # number of additional metadata tags on each file, other than artist/album/title
+    metadata_tags: int = 6
+    # if set, local files are picked from a library of this many tracks, so the
+    # same paths/metadata are played many times, like a real music library
+    library: Optional[int] = None
+    seed: int = 0
+
+
+def _library_track(track: int, cfg: CorpusConfig) -> Dict[str, Any]:
+    """
+    the metadata for a track in the library, the same each time its played
+    """
+    rand = random.Random(f"{cfg.seed}-{track}")
+    metadata = {
+        "title": f"Song {track}",
+        "album": f"Album {rand.randint(0, 50)}",
+        "artist": f"Artist {rand.randint(0, 500)}",
+    }
+    for i in range(cfg.metadata_tags):
+        metadata[f"tag_{i}"] = f"value {rand.getrandbits(32)}"
+    return metadata
+
+
+def _session_events(
+    rand: random.Random, socket_time: float, cfg: CorpusConfig
+) -> Dict[str, Dict[str, Any]]:
+    events: Dict[str, Dict[str, Any]] = {}
+    now = socket_time + rand.uniform(0.1, 10)
+
+    def add(name: str, data: Any = None) -> None:
+        nonlocal now
+        events[repr(now)] = {name: data}
+        now += rand.uniform(0.0001, 0.01)
+
+    is_stream = rand.random() < cfg.stream_ratio
+    count = rand.randint(cfg.min_playlist, cfg.max_playlist)
+    artist = f"Artist {rand.randint(0, 500)}"
+    album = f"Album {rand.randint(0, 50)}"
+    add("socket-added", now)
+    add("working-directory", f"/home/user/Music/{artist}/{album}")
+    add("playlist-count", count)
+    add("is-paused", False)
+    for pos in range(count):
+        add("playlist-pos", pos)
+        duration = rand.uniform(60, 420)
+        if is_stream:
+            add("path", f"https://www.youtube.com/watch?v={rand.getrandbits(48):012x}")
+            add("media-title", f"Stream {rand.getrandbits(32):08x}")
+            add("metadata", {})
+        elif cfg.library:
+            metadata = _library_track(rand.randrange(cfg.library), cfg)
+            add(
+                "path",
+                f"/home/user/Music/{metadata['artist']}/{metadata['album']}/{metadata['title']}.mp3",
+            )
+            add("media-title", metadata["title"])
+            add("metadata", metadata)
+            add("duration", duration)
+        else:
+            title = f"Song {rand.randint(0, 10000)}"
+            add("path", f"{pos + 1:02d} - {title}.mp3")
+            add("media-title", title)
+            metadata = {"title": title, "album": album, "artist": artist}
+            for i in range(cfg.metadata_tags):
+                metadata[f"tag_{i}"] = f"value {rand.getrandbits(32)}"
+            add("metadata", metadata)
+            add("duration", duration)
+        played = 0.0
+        while played < duration:
+            step = rand.uniform(5, duration)
+            played += step
+            now += step
+            percent = min(100.0, played / duration * 100)
+            if rand.random() < cfg.pause_density:
+                add("paused", {"percent-pos": percent})
+                now += rand.uniform(1, 120)
+                add("resumed", {"percent-pos": percent})
+            if rand.random() < cfg.seek_density:
+                add("seek", {"percent-pos": rand.uniform(0, 100)})
+        add("eof")
+    add("mpv-quit", now)
+    add("final-write", now + rand.uniform(0, 10))
+    return events
+
+
+def generate_sessions(cfg: CorpusConfig) -> Dict[str, Dict[str, Dict[str, Any]]]:
+    """
+    returns a mapping of filename -> events, like the 'mapping' in a merged file
+    """
+    rand = random.Random(cfg.seed)
+    sessions = {}
+    socket_time = 1_600_000_000.0
+    for _ in range(cfg.sessions):
+        socket_time += rand.uniform(600, 86400)
+        name = f"{int(socket_time * 1e9)}.json"
+        sessions[name] = _session_events(rand, socket_time, cfg)
+    return sessions
+
+
+def write_corpus(
+    out_dir: Path,
+    cfg: CorpusConfig,
+    *,
+    merged: Optional[int] = None,
+    data_format: DataFormat = "json",
+) -> List[Path]:
+    """
+    writes the corpus to out_dir, returning the files written
+
+    if merged is set, that many sessions are written to each merged
+    file, otherwise each session is written to its own event file
+    """
+    out_dir.mkdir(parents=True, exist_ok=True)
+    sessions = generate_sessions(cfg)
+    ext = FORMAT_EXTENSIONS[data_format]
+    written: List[Path] = []
+    if merged is None:
+        for name, events in sessions.items():
+            target = out_dir / f"{os.path.splitext(name)[0]}.{ext}"
+            target.write_bytes(dump_data(events, data_format))
+            written.append(target)
+    else:
+        names = sorted(sessions)
+        for i in range(0, len(names), merged):
+            chunk = {n: sessions[n] for n in names[i : i + merged]}
+            target = out_dir / f"merged-{i}.{ext}"
+            target.write_bytes(dump_data({"mapping": chunk}, data_format))
+            written.append(target)
+    return written
+
+
+_DEFAULTS = CorpusConfig._field_defaults
+
+
+@click.command()
+@click.argument("OUT_DIR", type=click.Path(path_type=Path, file_okay=False))
+@click.option("--sessions", type=int, default=_DEFAULTS["sessions"], show_default=True)
+@click.option(
+    "--min-playlist", type=int, default=_DEFAULTS["min_playlist"], show_default=True
+)
+@click.option(
+    "--max-playlist", type=int, default=_DEFAULTS["max_playlist"], show_default=True
+)
+@click.option(
+    "--pause-density", type=float, default=_DEFAULTS["pause_density"], show_default=True
+)
+@click.option(
+    "--seek-density", type=float, default=_DEFAULTS["seek_density"], show_default=True
+)
+@click.option(
+    "--stream-ratio", type=float, default=_DEFAULTS["stream_ratio"], show_default=True
+)
+@click.option(
+    "--metadata-tags", type=int, default=_DEFAULTS["metadata_tags"], show_default=True
+)
+@click.option(
+    "--library",
+    type=int,
+    default=None,
+    help="Pick local files from a library of this many tracks, instead of each being unique",
+)
+@click.option("--seed", type=int, default=_DEFAULTS["seed"], show_default=True)
+@click.option(
+    "--merged",
+    type=int,
+    default=None,
+    help="Write merged files with this many sessions each, instead of individual event files",
+)
+@click.option(
+    "--format",
+    "data_format",
+    type=click.Choice(["json", "msgpack"]),
+    default="json",
+    show_default=True,
+)
+def main(
+    out_dir: Path,
+    merged: Optional[int],
+    data_format: DataFormat,
+    **kwargs: Any,
+) -> None:
+    """
+    Generate a synthetic corpus of event files
+    """
+    files = write_corpus(
+        out_dir, CorpusConfig(**kwargs), merged=merged, data_format=data_format
+    )
+    click.echo(f"Wrote {len(files)} files to {out_dir}", err=True)
+
+
+if __name__ == "__main__":
+    main()
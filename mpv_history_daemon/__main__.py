@@ -1,30 +1,53 @@
 import os
 import datetime
-import shutil
-import logging
-import importlib
+import sys
 from pathlib import Path
 from typing import Any, Sequence, Iterator, Optional, Union, Literal
 from tempfile import gettempdir
-from kompress import CPath
 
 import click
-import simplejson
-from logzero import setup_logger  # type: ignore[import]
 
-from .daemon import run, SocketData
-from .events import history, all_history
-from .merge import merge_files
-from .serialize import dump_json
-from . import events as events_module
+# this is run by scripts/cron jobs many times, so to keep startup fast, anything
+# which isn't needed to build the CLI is imported in the command that uses it
+from .serialize import DATA_FORMATS, DataFormat, is_compressed
+from . import profiling
 
 
 @click.group(context_settings={"max_content_width": 100})
-def cli():
+@click.option(
+    "--profile",
+    is_flag=True,
+    default=False,
+    help="Record wall/CPU time and item counts for each stage of the command, and print a summary to stderr",
+)
+@click.option(
+    "--profile-output",
+    type=click.Path(dir_okay=False, path_type=Path),
+    default=None,
+    help="Also run cProfile, and dump the stats (readable with pstats/snakeviz) to this file",
+)
+@click.pass_context
+def cli(ctx: click.Context, profile: bool, profile_output: Optional[Path]) -> None:
     """
     Connects to mpv socket files and saves a history of events
     """
-    pass
+    if profile or profile_output is not None:
+        profiler = profiling.enable()
+        cprof: Optional[Any] = None
+        if profile_output is not None:
+            import cProfile
+
+            cprof = cProfile.Profile()
+            cprof.enable()
+
+        def _report() -> None:
+            if cprof is not None:
+                cprof.disable()
+                cprof.dump_stats(str(profile_output))
+                click.echo(f"Wrote cProfile stats to {profile_output}", err=True)
+            profiler.print_summary()
+
+        ctx.call_on_close(_report)
 
 
 def _parse_polling(
@@ -68,24 +91,109 @@ def _parse_polling(
     callback=_parse_polling,
     help="How often to scan for new mpv sockets files in the SOCKET_DIR - this is a manual scan of the directory every <n> seconds (default: 10). Set to 'disabled' to disable polling altogether",
 )
+@click.option(
+    "--max-scan-time",
+    envvar="MPV_HISTORY_DAEMON_MAX_SCAN_TIME",
+    show_envvar=True,
+    default=None,
+    type=int,
+    help="While no sockets are added or removed, the time between scans doubles up to this many seconds. New mpv instances may not be noticed until the next scan, so only set this if you signal the daemon when mpv starts (see below)  [default: the scan time, i.e. no backoff]",
+)
 @click.option(
     "--socket-class-qualname",
     type=str,
     default=None,
     help="Fully qualified name of the class to use for socket data, e.g., 'mpv_history_daemon.daemon.SocketData'. This imports the class and uses it for socket data.",
 )
+@click.option(
+    "--format",
+    "data_format",
+    type=click.Choice(DATA_FORMATS),
+    default="json",
+    show_default=True,
+    help="Format to write event files in. msgpack is smaller and faster to read/write, and requires the msgpack package",
+)
+@click.option(
+    "--metrics",
+    "enable_metrics",
+    is_flag=True,
+    default=False,
+    help="Record latency histograms for events, polling and writes. Send SIGUSR1 to the daemon to dump them to the log",
+)
+@click.option(
+    "--log-level",
+    type=click.Choice(["DEBUG", "INFO", "WARNING", "ERROR"], case_sensitive=False),
+    default="DEBUG",
+    show_default=True,
+    envvar="MPV_HISTORY_DAEMON_LOGLEVEL",
+    show_envvar=True,
+    help="Log level for the daemon. DEBUG logs every event, INFO skips formatting/logging those",
+)
+@click.option(
+    "--checkpoint-period",
+    type=int,
+    default=60,
+    show_default=True,
+    help="How often to checkpoint data for live mpv instances, so a restarted daemon resumes the same sessions. 0 to disable",
+)
+@click.option(
+    "--publish",
+    is_flag=True,
+    default=False,
+    help="Publish events and completed media to subscribers (see the tail command) over a unix socket",
+)
+@click.option(
+    "--publish-socket",
+    type=click.Path(dir_okay=False),
+    default=None,
+    help="Location of the unix socket for --publish  [default: $XDG_RUNTIME_DIR/mpv-history-daemon.sock]",
+)
+@click.option(
+    "--playlist",
+    "capture_playlist",
+    is_flag=True,
+    default=False,
+    help="Save the playlist of each mpv instance, and after that only changes to it",
+)
+@click.option(
+    "--compact-after",
+    type=click.IntRange(min=1),
+    default=None,
+    help="Compress event files for mpv instances which have exited, once no files have been written for this many seconds. Runs the compact command in the background, at a low priority",
+)
+@click.option(
+    "--compression",
+    type=click.Choice(["gz", "xz"]),
+    default="gz",
+    show_default=True,
+    help="Compression to use with --compact-after",
+)
 def daemon(
     socket_dir: str,
     data_dir: str,
     log_file: str,
     scan_time: Union[Literal["disabled"], int],
+    max_scan_time: Optional[int],
     write_period: Optional[int],
     socket_class_qualname: Optional[str],
+    data_format: DataFormat,
+    enable_metrics: bool,
+    log_level: str,
+    checkpoint_period: int,
+    publish: bool,
+    publish_socket: Optional[str],
+    capture_playlist: bool,
+    compact_after: Optional[int],
+    compression: Literal["gz", "xz"],
 ) -> None:
     """
     Socket dir is the directory with mpv sockets (/tmp/mpvsockets, probably)
     Data dir is the directory to store the history JSON files
     """
+    import importlib
+    import logging
+    from .daemon import run, SocketData
+
     socketclass = SocketData
     if socket_class_qualname is not None:
         module_name, class_name = socket_class_qualname.rsplit(".", 1)
@@ -93,6 +201,8 @@ def daemon(
         socketclass = getattr(module, class_name)
         assert issubclass(socketclass, SocketData)
     poll_time = scan_time if isinstance(scan_time, int) else None
+    if publish and publish_socket is None:
+        publish_socket = _default_publish_path()
     run(
         socket_dir=socket_dir,
         data_dir=data_dir,
@@ -100,23 +210,34 @@ def daemon(
         write_period=write_period,
         socket_data_cls=socketclass,
         poll_time=poll_time,
+        data_format=data_format,
+        enable_metrics=enable_metrics,
+        log_level=getattr(logging, log_level.upper()),
+        checkpoint_period=checkpoint_period,
+        publish_socket=publish_socket if publish else None,
+        max_poll_time=max_scan_time,
+        capture_playlist=capture_playlist,
+        compact_after=compact_after,
+        compression=compression,
     )
 
 
-def default_encoder(o: Any) -> Any:
-    if isinstance(o, datetime.datetime):
-        return int(o.timestamp())
-    raise TypeError(f"{o} of type {type(o)} is not serializable")
-
-
 def _parse_compressed(path: Path) -> Path:
+    if not is_compressed(path):
+        return path
+    from kompress import CPath  # type: ignore[import]
+
     return CPath(path)  # type: ignore
 
 
 def _resolve_paths(paths: Sequence[str]) -> Iterator[Path]:
     for p in map(Path, paths):
         if p.is_dir():
-            yield from map(_parse_compressed, (p.iterdir()))
+            # skip dotfiles, e.g. the daemons checkpoint
+            yield from map(
+                _parse_compressed,
+                (f for f in p.iterdir() if not f.name.startswith(".")),
+            )
         else:
             yield _parse_compressed(p)
 
@@ -135,21 +256,173 @@ def _resolve_paths(paths: Sequence[str]) -> Iterator[Path]:
     default=False,
     help="Increase log verbosity/print warnings while parsing JSON files",
 )
-def parse(data_files: Sequence[str], all_events: bool, debug: bool) -> None:
+@click.option(
+    "--dedupe",
+    is_flag=True,
+    default=False,
+    help="Remove duplicate media which appear in multiple files (e.g. both in a merged file and its original event file)",
+)
+@click.option(
+    "-j",
+    "--jobs",
+    type=int,
+    default=None,
+    help="Read/decompress files using this many threads, and report throughput for each compression type",
+)
+@click.option(
+    "--salvage",
+    is_flag=True,
+    default=False,
+    help="Instead of failing on truncated/corrupted files, recover all the complete events before the corruption and warn about what was dropped",
+)
+@click.option(
+    "--stream/--no-stream",
+    default=None,
+    help="Decode merged files one session at a time, so memory use is bounded by the largest session  [default: only for merged files over 32MiB]",
+)
+@click.option(
+    "--watch",
+    "watch_output",
+    type=click.Path(dir_okay=False, path_type=Path),
+    default=None,
+    help="Keep running, writing the output to this file, and updating it whenever the data files change (only re-parsing files which changed). Uses watchfiles if installed, otherwise polls",
+)
+def parse(
+    data_files: Sequence[str],
+    all_events: bool,
+    debug: bool,
+    dedupe: bool,
+    jobs: Optional[int],
+    salvage: bool,
+    stream: Optional[bool],
+    watch_output: Optional[Path],
+) -> None:
     """
     Takes the data directory and parses events into Media
     """
+    import logging
+    import simplejson
+    from logzero import setup_logger  # type: ignore[import]
+    from .events import history, all_history
+    from .reader import ReadStats
+    from .serialize import default_encoder
+    from . import events as events_module
+
     if debug:
         events_module.logger = setup_logger("mpv_history_events", level=logging.DEBUG)
     events_func: Any = all_history if all_events else history
+    if watch_output is not None:
+        from .watch import HistoryWatcher, watch_history
+
+        if jobs is not None:
+            raise click.UsageError("--jobs can't be used with --watch")
+        watcher = HistoryWatcher(
+            watch_output,
+            resolve=lambda: list(_resolve_paths(data_files)),
+            parse_file=lambda p: list(events_func([p], salvage=salvage, stream=stream)),
+            dedupe=dedupe,
+        )
+        try:
+            watch_history(watcher, [Path(p) for p in data_files])
+        except KeyboardInterrupt:
+            pass
+        return
     json_files = list(_resolve_paths(data_files))
-    click.echo(
-        simplejson.dumps(
-            list(events_func(json_files)),
+    read_stats = ReadStats() if jobs is not None else None
+    media = list(
+        events_func(
+            json_files,
+            dedupe=dedupe,
+            workers=jobs,
+            read_stats=read_stats,
+            salvage=salvage,
+            stream=stream,
+        )
+    )
+    with profiling.stage("encode", items=len(media)):
+        data = simplejson.dumps(
+            media,
             default=default_encoder,
             namedtuple_as_object=True,
         )
+    with profiling.stage("write"):
+        click.echo(data)
+    if read_stats is not None:
+        for line in read_stats.summary():
+            events_module.logger.info(line)
+
+
+@cli.command()
+@click.argument("DATA_FILES", type=click.Path(exists=True), nargs=-1, required=True)
+@click.option(
+    "-o",
+    "--output",
+    type=click.Path(dir_okay=False, path_type=Path),
+    required=True,
+    help="File to write to",
+)
+@click.option(
+    "--format",
+    "export_format",
+    # the same as export.EXPORT_FORMATS, not imported to keep startup fast
+    type=click.Choice(["parquet", "arrow"]),
+    default=None,
+    help="Format to write  [default: from the extension of --output (.arrow/.feather/.ipc for arrow), otherwise parquet]",
+)
+@click.option(
+    "--all-events",
+    is_flag=True,
+    default=False,
+    help="return all events, even ones which by context you probably didn't listen to",
+)
+@click.option(
+    "--dedupe",
+    is_flag=True,
+    default=False,
+    help="Remove duplicate media which appear in multiple files (e.g. both in a merged file and its original event file)",
+)
+@click.option(
+    "--salvage",
+    is_flag=True,
+    default=False,
+    help="Instead of failing on truncated/corrupted files, recover all the complete events before the corruption and warn about what was dropped",
+)
+@click.option(
+    "--batch-size",
+    type=click.IntRange(min=1),
+    default=10_000,
+    show_default=True,
+    help="Media per row group/record batch",
+)
+def export(
+    data_files: Sequence[str],
+    output: Path,
+    export_format: Optional[Literal["parquet", "arrow"]],
+    all_events: bool,
+    dedupe: bool,
+    salvage: bool,
+    batch_size: int,
+) -> None:
+    """
+    Export Media to a Parquet or Arrow IPC file
+
+    Requires pyarrow
+    """
+    from .events import history, all_history, logger
+    from .export import export_history, get_pyarrow
+
+    try:
+        get_pyarrow()
+    except RuntimeError as e:
+        raise click.ClickException(str(e))
+    events_func: Any = all_history if all_events else history
+    media = events_func(
+        list(_resolve_paths(data_files)), dedupe=dedupe, salvage=salvage
+    )
+    count = export_history(
+        media, output, export_format=export_format, batch_size=batch_size
     )
+    logger.info(f"Wrote {count} media to {output}")
 
 
 @cli.command()
@@ -176,23 +449,394 @@ def parse(data_files: Sequence[str], all_events: bool, debug: bool) -> None:
     show_envvar=True,
     help="If files have been modified in this amount of time, don't merge them",
 )
+@click.option(
+    "--format",
+    "data_format",
+    type=click.Choice(DATA_FORMATS),
+    default="json",
+    show_default=True,
+    help="Format to write the merged file in",
+)
 def merge(
-    data_files: Sequence[str], move: Optional[Path], write_to: Path, mtime_seconds: int
+    data_files: Sequence[str],
+    move: Optional[Path],
+    write_to: Path,
+    mtime_seconds: int,
+    data_format: DataFormat,
 ) -> None:
     """
     merges multiple files into a single merged event file
     """
+    import shutil
+    from .merge import merge_files, float_timestamp_keys
+    from .serialize import dump_data
+    from . import events as events_module
+
     json_files = list(_resolve_paths(list(data_files)))
     if move is not None:
         move.mkdir(parents=True, exist_ok=True)
     res = merge_files(json_files, mtime_seconds_since=mtime_seconds)
-    data = dump_json(res.merged_data)
+    merged_data = res.merged_data
+    with profiling.stage("encode", items=len(merged_data["mapping"])):
+        if data_format != "json":
+            merged_data = float_timestamp_keys(merged_data)
+        data = dump_data(merged_data, data_format)
     if move is not None:
-        for old in res.consumed_files:
-            new = move / old.name
-            events_module.logger.info(f"Moving {old} to {new}")
-            shutil.move(str(old), str(new))
-    write_to.write_text(data)
+        with profiling.stage("move", items=len(res.consumed_files)):
+            for old in res.consumed_files:
+                new = move / old.name
+                events_module.logger.info(f"Moving {old} to {new}")
+                shutil.move(str(old), str(new))
+    with profiling.stage("write"):
+        write_to.write_bytes(data)
+
+
+@cli.command()
+@click.argument(
+    "DATA_DIR", type=click.Path(exists=True, file_okay=False, path_type=Path)
+)
+@click.option(
+    "--compression",
+    type=click.Choice(["gz", "xz"]),
+    default="gz",
+    show_default=True,
+    help="Compression to use. Both can be read by parse/merge",
+)
+@click.option(
+    "--quiet-period",
+    type=int,
+    default=3600,
+    show_default=True,
+    help="If files have been modified in this amount of time, don't compact them",
+)
+@click.option(
+    "--low-priority",
+    is_flag=True,
+    default=False,
+    help="Run at the lowest CPU priority, and the idle I/O class (if ionice is installed)",
+)
+def compact(
+    data_dir: Path,
+    compression: Literal["gz", "xz"],
+    quiet_period: int,
+    low_priority: bool,
+) -> None:
+    """
+    Compress event files for mpv instances which have exited
+
+    Each finalized <name>.json/msgpack file in DATA_DIR is replaced
+    by <name>.json.gz (or .xz)
+    """
+    from .compact import compact_files, event_files, lower_priority
+    from .events import logger
+
+    if low_priority:
+        lower_priority()
+    files = event_files(data_dir)
+    with profiling.stage("compact", items=len(files)):
+        res = compact_files(files, compression=compression, quiet_period=quiet_period)
+    logger.info(
+        f"Compacted {len(res.compacted)} files ({res.bytes_before} -> {res.bytes_after} bytes), skipped {res.skipped}"
+    )
+
+
+def _default_index_path() -> Path:
+    from .query import default_index_path
+
+    return default_index_path()
+
+
+def _parse_timestamp(
+    ctx: click.Context, param: click.Parameter, value: Optional[str]
+) -> Optional[float]:
+    if value is None:
+        return None
+    try:
+        return float(value)
+    except ValueError:
+        pass
+    try:
+        dt = datetime.datetime.fromisoformat(value)
+    except ValueError:
+        raise click.BadParameter(
+            f"must be an epoch timestamp or an ISO datetime, got {value!r}",
+            ctx=ctx,
+            param=param,
+        )
+    return dt.timestamp()
+
+
+@cli.command()
+@click.argument("DATA_FILES", type=click.Path(exists=True), nargs=-1, required=True)
+@click.option(
+    "--index-file",
+    type=click.Path(path_type=Path, dir_okay=False),
+    default=_default_index_path,
+    envvar="MPV_HISTORY_INDEX_FILE",
+    show_envvar=True,
+    help="Location of the sqlite index, updated with any new/changed DATA_FILES before querying",
+)
+@click.option(
+    "--since",
+    callback=_parse_timestamp,
+    help="Only media started at/after this epoch timestamp/ISO datetime",
+)
+@click.option(
+    "--until",
+    callback=_parse_timestamp,
+    help="Only media started before this epoch timestamp/ISO datetime",
+)
+@click.option("--path-prefix", type=str, help="Only media whose path starts with this")
+@click.option(
+    "--title", type=str, help="Case-insensitive substring of the title/media title"
+)
+@click.option("--artist", type=str, help="Case-insensitive substring of the artist")
+@click.option(
+    "--stream/--local",
+    "is_stream",
+    default=None,
+    help="Only streams (URLs) or only local files",
+)
+@click.option(
+    "--min-listen-time",
+    type=float,
+    default=None,
+    help="Only media listened to for at least this many seconds",
+)
+@click.option(
+    "--all-events",
+    is_flag=True,
+    default=False,
+    help="return all events, even ones which by context you probably didn't listen to",
+)
+@click.option("--reverse", is_flag=True, default=False, help="Most recent media first")
+@click.option("--limit", type=int, default=None, help="Maximum number of results")
+def query(
+    data_files: Sequence[str],
+    index_file: Path,
+    since: Optional[float],
+    until: Optional[float],
+    path_prefix: Optional[str],
+    title: Optional[str],
+    artist: Optional[str],
+    is_stream: Optional[bool],
+    min_listen_time: Optional[float],
+    all_events: bool,
+    reverse: bool,
+    limit: Optional[int],
+) -> None:
+    """
+    Query Media using a persistent index of the data files
+    """
+    from .query import HistoryIndex
+    from . import events as events_module
+
+    json_files = list(_resolve_paths(data_files))
+    with HistoryIndex(index_file) as index:
+        res = index.update(json_files)
+        events_module.logger.debug(
+            f"Indexed {len(res.parsed)} files, removed {len(res.removed)}, {res.unchanged} unchanged"
+        )
+        sys.stdout.write("[")
+        for i, data in enumerate(
+            index.query(
+                since=since,
+                until=until,
+                path_prefix=path_prefix,
+                title=title,
+                artist=artist,
+                is_stream=is_stream,
+                min_listen_time=min_listen_time,
+                all_events=all_events,
+                reverse=reverse,
+                limit=limit,
+            )
+        ):
+            if i > 0:
+                sys.stdout.write(", ")
+            sys.stdout.write(data)
+        sys.stdout.write("]\n")
+
+
+def _default_stats_path() -> Path:
+    from .stats import default_stats_path
+
+    return default_stats_path()
+
+
+@cli.command()
+@click.argument("DATA_FILES", type=click.Path(exists=True), nargs=-1, required=True)
+@click.option(
+    "--stats-file",
+    type=click.Path(path_type=Path, dir_okay=False),
+    default=_default_stats_path,
+    envvar="MPV_HISTORY_STATS_FILE",
+    show_envvar=True,
+    help="Location of the sqlite rollups, updated with any new/changed DATA_FILES before reading",
+)
+@click.option(
+    "-k",
+    "--kind",
+    type=click.Choice(["artist", "album", "title", "day", "week", "dir", "root"]),
+    default="artist",
+    show_default=True,
+    help="What to total listen time/plays by. day/week are in UTC, dir is the directory (or domain, for streams)",
+)
+@click.option(
+    "--root",
+    "roots",
+    multiple=True,
+    help="Library directory to group local files by for --kind root, can be passed multiple times. Streams are grouped by domain",
+)
+@click.option(
+    "--sort",
+    type=click.Choice(["time", "plays", "key"]),
+    default=None,
+    help="Sort by listen time, number of plays or the key  [default: key for day/week, time otherwise]",
+)
+@click.option("--limit", type=int, default=None, help="Maximum number of results")
+def stats(
+    data_files: Sequence[str],
+    stats_file: Path,
+    kind: str,
+    roots: Sequence[str],
+    sort: Optional[str],
+    limit: Optional[int],
+) -> None:
+    """
+    Listening statistics, from persistent rollups of the data files
+
+    Only media which was actually listened to is counted (like parse)
+    """
+    import simplejson
+    from .stats import StatsStore
+    from . import events as events_module
+
+    json_files = list(_resolve_paths(data_files))
+    with StatsStore(stats_file) as store:
+        res = store.update(json_files)
+        events_module.logger.debug(
+            f"Updated stats with {len(res.parsed)} files, removed {len(res.removed)}, {res.unchanged} unchanged"
+        )
+        click.echo(
+            simplejson.dumps(
+                store.top(
+                    kind,
+                    sort=sort,
+                    limit=limit,
+                    roots=[os.path.expanduser(r) for r in roots],
+                ),
+                namedtuple_as_object=True,
+            )
+        )
+
+
+@cli.command()
+@click.argument("DATA_FILES", type=click.Path(exists=True), nargs=-1, required=True)
+@click.option(
+    "--path",
+    "paths",
+    type=str,
+    multiple=True,
+    help="Only compute heatmaps for these paths (can be passed multiple times)  [default: all]",
+)
+@click.option(
+    "--bins",
+    type=click.IntRange(min=1),
+    default=20,
+    show_default=True,
+    help="Number of bins to split 0-100% into",
+)
+@click.option(
+    "--skip-below",
+    type=float,
+    default=95.0,
+    show_default=True,
+    help="Plays which stopped before this percentage count as skips",
+)
+@click.option(
+    "--dedupe",
+    is_flag=True,
+    default=False,
+    help="Remove duplicate media which appear in multiple files (e.g. both in a merged file and its original event file)",
+)
+@click.option("--limit", type=int, default=None, help="Only the most played paths")
+def heatmap(
+    data_files: Sequence[str],
+    paths: Sequence[str],
+    bins: int,
+    skip_below: float,
+    dedupe: bool,
+    limit: Optional[int],
+) -> None:
+    """
+    Where you seek to, pause at and skip media, across all your history
+
+    Prints a JSON list, with counts for each bin for each path, most played first.
+    Requires numpy
+    """
+    import simplejson
+    from .events import all_history
+    from .analysis import heatmaps, get_numpy
+
+    try:
+        get_numpy()
+    except RuntimeError as e:
+        raise click.ClickException(str(e))
+    # all events, since the media which would be filtered out are the skips
+    res = heatmaps(
+        all_history(list(_resolve_paths(data_files)), dedupe=dedupe),
+        paths=paths or None,
+        bins=bins,
+        skip_below=skip_below,
+    )
+    click.echo(simplejson.dumps(list(res.values())[:limit], namedtuple_as_object=True))
+
+
+def _default_publish_path() -> str:
+    from .publish import default_publish_path
+
+    return default_publish_path()
+
+
+@cli.command()
+@click.option(
+    "--socket",
+    "socket_path",
+    type=click.Path(dir_okay=False),
+    default=None,
+    help="Location of the daemons --publish socket  [default: $XDG_RUNTIME_DIR/mpv-history-daemon.sock]",
+)
+@click.option(
+    "--media-only",
+    is_flag=True,
+    default=False,
+    help="Only print Media, as each file finishes playing",
+)
+def tail(socket_path: Optional[str], media_only: bool) -> None:
+    """
+    Print events/media as they happen, from a daemon running with --publish
+
+    Prints one JSON object per line
+    """
+    import simplejson
+    from .publish import subscribe
+
+    if socket_path is None:
+        socket_path = _default_publish_path()
+    try:
+        for record in subscribe(socket_path):
+            if media_only:
+                if record["type"] != "media":
+                    continue
+                record = record["media"]
+            click.echo(simplejson.dumps(record))
+    except (FileNotFoundError, ConnectionRefusedError) as e:
+        raise click.ClickException(
+            f"Could not connect to {socket_path}, is the daemon running with --publish? ({e})"
+        )
+    except KeyboardInterrupt:
+        pass
 
 
 if __name__ == "__main__":
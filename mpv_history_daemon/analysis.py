@@ -0,0 +1,138 @@
+"""
+Where in a piece of media you seek to, pause at, and stop playing,
+aggregated across every time it was played
+
+The actions of all the Media are flattened into arrays once, and then
+binned with numpy, instead of looping over each Action in python.
+Requires numpy
+"""
+
+from operator import itemgetter
+from typing import Any, Dict, Iterable, List, NamedTuple, Optional, Sequence
+
+from .events import Media
+
+# number of bins the 0-100% range is split into
+BINS = 20
+
+# a play which ended before this percentage (of a file with a known duration)
+# counts as skipped, at the position it was stopped
+SKIP_BELOW = 95.0
+
+
+def get_numpy() -> Any:
+    """
+    imports numpy, only once it's needed
+    """
+    try:
+        import numpy  # type: ignore[import]
+    except ImportError:
+        raise RuntimeError(
+            "numpy is not installed, install it with 'pip install mpv_history_daemon[analysis]' to analyze history"
+        )
+    return numpy
+
+
+class Heatmap(NamedTuple):
+    path: str
+    plays: int
+    # counts for each bin, bin i is [i * 100 / bins, (i + 1) * 100 / bins)%
+    seeks: List[int]
+    pauses: List[int]
+    skips: List[int]
+
+
+def heatmaps(
+    media: Iterable[Media],
+    *,
+    paths: Optional[Sequence[str]] = None,
+    bins: int = BINS,
+    skip_below: float = SKIP_BELOW,
+) -> Dict[str, Heatmap]:
+    """
+    Heatmaps for every path in media (or only those in paths), sorted by
+    the number of plays. To include plays which were skipped, media should
+    come from all_history, not history (which filters those out)
+
+    seeks are the positions seeked to, pauses the positions paused at, and
+    skips the positions where plays which didn't reach skip_below% stopped
+    """
+    np = get_numpy()
+    wanted = set(paths) if paths is not None else None
+    selected = [m for m in media if wanted is None or m.path in wanted]
+    index: Dict[str, int] = {}
+    media_path = np.array(
+        [index.setdefault(m.path, len(index)) for m in selected], dtype=np.int64
+    )
+    npaths = len(index)
+
+    # one entry per action, across all media. None percentages become NaN
+    counts = np.array([len(m.actions) for m in selected], dtype=np.int64)
+    action_media = np.repeat(np.arange(len(selected)), counts)
+    actions = [a for m in selected for a in m.actions]
+    since = np.array(list(map(itemgetter(0), actions)), dtype=np.float64)
+    names = np.array(list(map(itemgetter(1), actions)), dtype=object)
+    pct = np.array(list(map(itemgetter(2), actions)), dtype=np.float64)
+    del actions
+    seek = names == "seek"
+    paused = names == "paused"
+
+    def _binned(mask: Any, values: Any, owners: Any) -> Any:
+        """
+        (paths, bins) counts of values (percentages) for the entries in mask
+        """
+        b = np.clip((values[mask] * bins / 100).astype(np.int64), 0, bins - 1)
+        flat = np.bincount(owners[mask] * bins + b, minlength=npaths * bins)
+        return flat.reshape(npaths, bins)
+
+    known = ~np.isnan(pct)
+    action_path = media_path[action_media]
+    seeks = _binned(known & seek, pct, action_path)
+    pauses = _binned(known & paused, pct, action_path)
+
+    # where each play stopped: from the last action with a position, plus
+    # however long it played after that, otherwise from the listen time
+    duration = np.array([m.media_duration or np.nan for m in selected], np.float64)
+    played_for = np.array(
+        [(m.end_time - m.start_time).total_seconds() for m in selected], np.float64
+    )
+    pause_duration = np.array([m.pause_duration for m in selected], np.float64)
+    stopped = (played_for - pause_duration) / duration * 100
+    last = np.full(len(selected), -1, dtype=np.int64)
+    positioned = np.flatnonzero(known)
+    owners = action_media[positioned]
+    # actions are grouped by media, so the last one is where the owner changes
+    is_last = np.ones(owners.size, dtype=bool)
+    is_last[:-1] = owners[1:] != owners[:-1]
+    last[owners[is_last]] = positioned[is_last]
+    has_last = last >= 0
+    li = last[has_last]
+    after = np.where(
+        paused[li],
+        0.0,
+        (played_for[has_last] - since[li]) / duration[has_last] * 100,
+    )
+    stopped[has_last] = pct[li] + after
+    skipped = ~np.isnan(stopped) & (stopped < skip_below)
+    skips = _binned(skipped, stopped, media_path)
+
+    plays = np.bincount(media_path, minlength=npaths)
+    result = [
+        Heatmap(
+            path=path,
+            plays=int(plays[i]),
+            seeks=seeks[i].tolist(),
+            pauses=pauses[i].tolist(),
+            skips=skips[i].tolist(),
+        )
+        for path, i in index.items()
+    ]
+    result.sort(key=lambda h: h.plays, reverse=True)
+    return {h.path: h for h in result}
+
+
+def heatmap(media: Iterable[Media], path: str, **kwargs: Any) -> Optional[Heatmap]:
+    """
+    the Heatmap for one path, None if it wasn't played. kwargs are passed to heatmaps
+    """
+    return heatmaps(media, paths=[path], **kwargs).get(path)
@@ -0,0 +1,70 @@
+"""
+Checkpoints the daemons in-memory socket data to disk
+
+The daemon periodically saves the state of each live mpv socket (its events,
+playlist position, when to write next), so if it is restarted (e.g. by
+bin/mpv_history_daemon_restart) or crashes, the new daemon can reattach
+to the mpv instances which are still running and continue the same session,
+instead of re-polling mpv and overwriting the event file for that socket
+"""
+
+import os
+from pathlib import Path
+from typing import Any, Dict, Union
+
+from logzero import logger  # type: ignore[import]
+
+from .serialize import dump_json, parse_json_bytes
+
+CHECKPOINT_VERSION = 1
+
+# a dotfile, so its skipped when the data dir is passed to parse/merge
+CHECKPOINT_FILENAME = ".mpv-history-daemon-checkpoint.json"
+
+PathIsh = Union[str, os.PathLike]
+
+# socket location -> state, from SocketData.checkpoint_state
+States = Dict[str, Dict[str, Any]]
+
+
+def checkpoint_path(data_dir: PathIsh) -> Path:
+    return Path(data_dir) / CHECKPOINT_FILENAME
+
+
+def save_checkpoint(path: PathIsh, states: States) -> int:
+    """
+    atomically write the checkpoint, returns the number of bytes written
+    """
+    data = dump_json({"version": CHECKPOINT_VERSION, "sockets": states}).encode("utf-8")
+    tmp = f"{path}.tmp"
+    with open(tmp, "wb") as f:
+        f.write(data)
+    os.replace(tmp, path)
+    return len(data)
+
+
+def load_checkpoint(path: PathIsh) -> States:
+    """
+    read the checkpoint, if there is one. A corrupted checkpoint or one
+    from an incompatible version is ignored, returning no states
+    """
+    try:
+        with open(path, "rb") as f:
+            data = parse_json_bytes(f.read())
+    except FileNotFoundError:
+        return {}
+    except Exception as e:
+        logger.warning(f"Could not read checkpoint {path}, ignoring: {e}")
+        return {}
+    if not isinstance(data, dict) or data.get("version") != CHECKPOINT_VERSION:
+        logger.warning(f"Ignoring checkpoint {path} from a different version")
+        return {}
+    states: States = data["sockets"]
+    return states
+
+
+def clear_checkpoint(path: PathIsh) -> None:
+    try:
+        os.remove(path)
+    except FileNotFoundError:
+        pass
@@ -0,0 +1,219 @@
+"""
+Compresses finalized event files
+
+Once an mpv instance exits, the daemon writes its event file one last time
+(with a 'final-write' event), and never touches it again. Those are compressed
+to <name>.json.gz (or .xz), which parse/merge read like any other compressed
+file, and the original is removed once the compressed file is in place
+
+Files which were modified recently (or don't end with a 'final-write'/'summary'
+event yet) are skipped, so this can run while the daemon is writing to the directory
+"""
+
+import gzip
+import lzma
+import os
+import shutil
+import subprocess
+import sys
+import time
+from itertools import islice
+from pathlib import Path
+from typing import Iterable, List, Literal, NamedTuple, Optional, Tuple
+
+from .events import logger
+from .serialize import (
+    COMPRESSED_EXTENSIONS,
+    FORMAT_EXTENSIONS,
+    parse_data_bytes,
+    read_file_bytes,
+)
+
+CompressionFormat = Literal["gz", "xz"]
+COMPRESSION_FORMATS: Tuple[CompressionFormat, ...] = ("gz", "xz")
+
+# files modified less than this many seconds ago are left alone
+QUIET_PERIOD = 3600
+
+# events the daemon only writes when its done with a file
+_FINAL_EVENTS = ("final-write", "summary")
+# how many of the last events to look for those in
+_FINAL_EVENTS_WITHIN = 4
+
+_EVENT_SUFFIXES = tuple(f".{ext}" for ext in FORMAT_EXTENSIONS.values())
+
+
+class CompactResult(NamedTuple):
+    compacted: List[Path]
+    # not finalized, or modified recently
+    skipped: int
+    bytes_before: int
+    bytes_after: int
+
+
+def is_finalized(data: bytes) -> bool:
+    """
+    whether data is an event file which the daemon has finished writing to.
+    Merged files are left alone, they're written by merge, not the daemon
+    """
+    try:
+        events = parse_data_bytes(data)
+    except Exception as e:
+        logger.warning(f"Could not decode file, not compacting it: {e}")
+        return False
+    if not isinstance(events, dict) or "mapping" in events:
+        return False
+    # these are at the end, other than (rarely) an event which was still
+    # being applied when the daemon wrote the file
+    return any(
+        isinstance(event, dict) and any(name in event for name in _FINAL_EVENTS)
+        for event in islice(reversed(events.values()), _FINAL_EVENTS_WITHIN)
+    )
+
+
+def finalized_file(data_dir: Path, name: str) -> Optional[Path]:
+    """
+    the event file for name (the socket time) in data_dir, if the daemon has
+    finished writing it. Looks for compacted files too
+    """
+    for ext in FORMAT_EXTENSIONS.values():
+        base = data_dir / f"{name}.{ext}"
+        for p in (
+            base,
+            *(base.with_name(base.name + c) for c in COMPRESSED_EXTENSIONS),
+        ):
+            if not p.is_file():
+                continue
+            try:
+                data = read_file_bytes(p)
+            except Exception as e:
+                logger.warning(f"Could not read {p}: {e}")
+                continue
+            if is_finalized(data):
+                return p
+    return None
+
+
+def compress_bytes(data: bytes, compression: CompressionFormat = "gz") -> bytes:
+    if compression == "gz":
+        # mtime=0, so compressing the same file twice gives the same bytes
+        return gzip.compress(data, compresslevel=6, mtime=0)
+    elif compression == "xz":
+        return lzma.compress(data)
+    raise ValueError(
+        f"Unknown compression {compression}, expected one of {COMPRESSION_FORMATS}"
+    )
+
+
+def event_files(data_dir: Path) -> List[Path]:
+    """
+    uncompressed event files in data_dir, skipping dotfiles (e.g. the checkpoint)
+    """
+    return sorted(
+        p
+        for p in data_dir.iterdir()
+        if p.suffix in _EVENT_SUFFIXES and not p.name.startswith(".") and p.is_file()
+    )
+
+
+def compact_file(p: Path, compression: CompressionFormat = "gz") -> Optional[Path]:
+    """
+    compress p if its finalized, returning the compressed file
+    """
+    data = p.read_bytes()
+    if not is_finalized(data):
+        return None
+    target = p.with_name(f"{p.name}.{compression}")
+    tmp = p.with_name(f".{target.name}.tmp")
+    st = p.stat()
+    try:
+        with open(tmp, "wb") as f:
+            f.write(compress_bytes(data, compression))
+            f.flush()
+            # make sure its on disk before the original is removed
+            os.fsync(f.fileno())
+        # keep the original mtime, so this still sorts/filters (e.g. merge --mtime-seconds) the same
+        os.utime(tmp, ns=(st.st_atime_ns, st.st_mtime_ns))
+        os.replace(tmp, target)
+    except BaseException:
+        tmp.unlink(missing_ok=True)
+        raise
+    p.unlink()
+    return target
+
+
+def compact_files(
+    files: Iterable[Path],
+    *,
+    compression: CompressionFormat = "gz",
+    quiet_period: float = QUIET_PERIOD,
+    now: Optional[float] = None,
+) -> CompactResult:
+    """
+    compress each of files which is finalized and hasn't been modified in quiet_period seconds
+    """
+    now = time.time() if now is None else now
+    compacted: List[Path] = []
+    skipped = 0
+    before = after = 0
+    for p in files:
+        try:
+            st = p.stat()
+        except FileNotFoundError:
+            continue
+        if now - st.st_mtime < quiet_period:
+            skipped += 1
+            continue
+        target = compact_file(p, compression)
+        if target is None:
+            skipped += 1
+            continue
+        size = target.stat().st_size
+        logger.debug(f"Compacted {p} to {target} ({st.st_size} -> {size} bytes)")
+        compacted.append(target)
+        before += st.st_size
+        after += size
+    return CompactResult(
+        compacted=compacted, skipped=skipped, bytes_before=before, bytes_after=after
+    )
+
+
+def lower_priority() -> None:
+    """
+    run the rest of this process at the lowest CPU priority, and the idle
+    I/O class (if ionice is installed), so compaction doesn't compete with anything else
+    """
+    os.nice(19)
+    ionice = shutil.which("ionice")
+    if ionice is not None:
+        subprocess.run(
+            [ionice, "-c", "3", "-p", str(os.getpid())],
+            stdout=subprocess.DEVNULL,
+            stderr=subprocess.DEVNULL,
+            check=False,
+        )
+
+
+def spawn_compact(
+    data_dir: str, *, compression: CompressionFormat, quiet_period: int
+) -> "subprocess.Popen[bytes]":
+    """
+    run the compact command in the background, at a low priority
+    """
+    return subprocess.Popen(
+        [
+            sys.executable,
+            "-m",
+            "mpv_history_daemon",
+            "compact",
+            "--low-priority",
+            "--compression",
+            compression,
+            "--quiet-period",
+            str(quiet_period),
+            data_dir,
+        ],
+        stdin=subprocess.DEVNULL,
+        stdout=subprocess.DEVNULL,
+        stderr=subprocess.DEVNULL,
+    )
@@ -16,19 +16,47 @@ BrokenPipes are captured in the event_eof function
 
 import os
 import atexit
+import logging
 import threading
 import signal
+import subprocess
 from pathlib import Path
-from typing import List, Optional, Dict, Any, Type
-from time import sleep, time
+from queue import SimpleQueue
+from typing import (
+    List,
+    Optional,
+    Dict,
+    Any,
+    Type,
+    Hashable,
+    NamedTuple,
+    Sequence,
+    Tuple,
+    Union,
+)
+from time import sleep, time, perf_counter, monotonic
 
 from python_mpv_jsonipc import MPV  # type: ignore[import]
-from logzero import logger, logfile  # type: ignore[import]
+from logzero import logger, logfile, loglevel  # type: ignore[import]
 
-from .serialize import dump_json
+from . import metrics
+from .checkpoint import (
+    checkpoint_path,
+    save_checkpoint,
+    load_checkpoint,
+    clear_checkpoint,
+)
+from .compact import CompressionFormat, finalized_file, spawn_compact
+from .events import Reconstructor, summarize
+from .playlist import playlist_delta
+from .publish import Publisher
+from .serialize import dump_data, DataFormat, FORMAT_EXTENSIONS
 
 SCAN_TIME: int = int(os.environ.get("MPV_HISTORY_DAEMON_SCAN_TIME", 10))
 
+# how many scans in a row have to find nothing new before the scan time starts backing off
+IDLE_SCANS: int = 3
+
 
 KNOWN_EVENTS = set(
     [
@@ -47,6 +75,9 @@ KNOWN_EVENTS = set(
         "path",
         "working-directory",
         "final-write",  # custom event, for when the dead/dangling socket was removed, and file was written
+        "playlist",  # with --playlist, the full playlist
+        "playlist-delta",  # with --playlist, changes to the playlist, see playlist.py
+        "summary",  # custom event, after final-write, the media reconstructed from this file
     ]
 )
 
@@ -60,7 +91,47 @@ def new_event(event_name: str, event_data: Any = None) -> Dict[str, Any]:
     return {event_name: event_data}
 
 
-# disabled for now
+class RateLimit:
+    """
+    allows something (e.g. a log message) at most once per interval for each key.
+    Keys are never removed, so use a small, fixed set of them
+    """
+
+    def __init__(self, interval: float) -> None:
+        self.interval = interval
+        self._last: Dict[Hashable, float] = {}
+
+    def allow(self, key: Hashable) -> bool:
+        now = monotonic()
+        last = self._last.get(key)
+        if last is not None and now - last < self.interval:
+            return False
+        self._last[key] = now
+        return True
+
+
+# polling retries every 0.1 seconds, only log retries of each property once a second
+_poll_log_limit = RateLimit(1.0)
+
+
+class Ingest(NamedTuple):
+    """
+    something an observer saw, queued for the consumer thread of its socket
+    """
+
+    socket_data: "SocketData"
+    # 'pause', 'eof', 'seek', 'playlist' or 'quit'
+    action: str
+    value: Any
+    # when mpv notified us, used as the timestamp of the event
+    at: float
+    # perf_counter when this was queued, for metrics
+    queued: float
+    # for pause/seek, the percent-pos read by the observer, so its the position
+    # at 'at', not whenever this is applied. A tuple, since the position can be None
+    percent_pos: Optional[Tuple[Any]] = None
+
+
 def clean_playlist(mpv_playlist_response: List[Dict]) -> List[str]:
     """
     simplifies the playlist response from mpv
@@ -75,8 +146,7 @@ def clean_playlist(mpv_playlist_response: List[Dict]) -> List[str]:
             logger.warning(f"No filename in playlist info!: {pinfo}")
         else:
             filenames.append(pinfo["filename"])
-    # truncate to 50 filenames
-    return filenames[:50]
+    return filenames
 
 
 class SocketData:
@@ -99,6 +169,38 @@ class SocketData:
                 # duration
     """
 
+    # format to write the data file in, set by the LoopHandler
+    data_format: DataFormat = "json"
+    # if set (by the LoopHandler), events and completed media are published here
+    publisher: Optional[Publisher] = None
+    # reconstructs media from the events as they happen, when publishing
+    _reconstructor: Optional[Reconstructor] = None
+    _publish_lock = threading.Lock()
+    # set by apply, the timestamp for the next event
+    _event_at: Optional[float] = None
+    # set by apply, the percent-pos the observer read
+    _observed_percent_pos: Optional[Tuple[Any]] = None
+    # held while events are added, set to the LoopHandler's lock, which
+    # is held while socket data is written
+    lock: "threading.RLock" = threading.RLock()
+    # the dirty watermark, events are only ever added, so if the count
+    # hasn't changed since the last write, the file is up to date
+    written_event_count: int = -1
+    # size of the last write, in bytes
+    written_size: int = 0
+    # the last playlist saved, with --playlist. deltas are saved against this
+    playlist: Optional[List[str]] = None
+
+    # attributes saved in checkpoints (along with the events), so a restarted
+    # daemon can resume this session. Subclasses with additional state can extend this
+    _checkpoint_attrs = (
+        "socket_time",
+        "playlist_count",
+        "playlist_index",
+        "write_period",
+        "write_at",
+    )
+
     def __init__(
         self,
         socket: MPV,
@@ -136,9 +238,16 @@ class SocketData:
         self.store_file_metadata()
 
     @property
-    def event_count(self):
+    def event_count(self) -> int:
         return len(self.events)
 
+    @property
+    def dirty(self) -> bool:
+        """
+        whether there are events which haven't been written to the file yet
+        """
+        return self.event_count != self.written_event_count
+
     _repr_attrs = ("socket", "socket_loc", "event_count")
 
     def __repr__(self) -> str:
@@ -154,25 +263,127 @@ class SocketData:
 
     __str__ = __repr__
 
+    def checkpoint_state(self) -> Dict[str, Any]:
+        """
+        the state needed to resume this session if the daemon restarts
+        """
+        state = {a: getattr(self, a) for a in self._checkpoint_attrs}
+        state["events"] = dict(self.events)
+        return state
+
+    @classmethod
+    def from_checkpoint(
+        cls, socket_loc: str, data_dir: str, state: Dict[str, Any]
+    ) -> "SocketData":
+        """
+        restore from a checkpoint, without polling mpv. The socket is
+        None until scan_sockets reconnects to it
+        """
+        sd = cls.__new__(cls)
+        sd.socket = None
+        sd.socket_loc = socket_loc
+        sd.data_dir = data_dir
+        for attr in cls._checkpoint_attrs:
+            setattr(sd, attr, state[attr])
+        # JSON keys are strings, convert the timestamps back
+        sd.events = {float(ts): event for ts, event in state["events"].items()}
+        return sd
+
     def write(self) -> None:
-        serialized = dump_json(self.events)
+        start = perf_counter()
+        event_count = self.event_count
+        serialized = dump_data(self.events, self.data_format)
+        ext = FORMAT_EXTENSIONS[self.data_format]
         with open(
-            os.path.join(self.data_dir, f"{self.socket_time}.json"), "w"
+            os.path.join(self.data_dir, f"{self.socket_time}.{ext}"), "wb"
         ) as event_f:
             event_f.write(serialized)
+        self.written_event_count = event_count
+        self.written_size = len(serialized)
+        if metrics.enabled:
+            metrics.record_seconds("write", perf_counter() - start)
+            metrics.record("write.size", len(serialized), "B")
 
     def nevent(self, event_name: str, event_data: Optional[Any] = None) -> None:
         """add an event"""
-        ct = time()
-        logger.debug(f"{self.socket_time}|{ct}|{event_name}|{event_data}")
-        self.events[ct] = new_event(event_name, event_data)
+        ct = self._event_at
+        if ct is None:
+            ct = time()
+        else:
+            self._event_at = None
+        # metadata can be large, so don't format this unless its going to be logged
+        if logger.isEnabledFor(logging.DEBUG):
+            logger.debug(
+                "%s|%s|%s|%s",
+                self.socket_time,
+                ct,
+                event_name,
+                event_data,
+                extra={
+                    "socket_time": self.socket_time,
+                    "event_time": ct,
+                    "event_name": event_name,
+                },
+            )
+        with self.lock:
+            self.events[ct] = new_event(event_name, event_data)
+        if self.publisher is not None:
+            self.publish(ct, event_name, event_data)
+
+    def store_summary(self) -> None:
+        """
+        save the media reconstructed from the events as the last event, so
+        parsing this file later doesn't have to reconstruct them again
+        """
+        start = perf_counter()
+        try:
+            summary = summarize(self.events, self.socket_time)
+        except Exception as e:
+            # parse reconstructs the media like it would without the summary
+            logger.exception(f"{self.socket_time}|could not summarize events: {e}")
+            return
+        # after every other event, and not added with nevent, since
+        # theres no need to log/publish a copy of the media
+        ct = max(time(), max(self.events, default=0) + 0.001)
+        self.events[ct] = new_event("summary", summary)
+        if metrics.enabled:
+            metrics.record_seconds("summary", perf_counter() - start)
+
+    def publish(self, ct: float, event_name: str, event_data: Any) -> None:
+        """
+        publish the event, and any media it completed, to subscribers
+        """
+        assert self.publisher is not None
+        with self._publish_lock:
+            if self._reconstructor is None:
+                # if this was restored from a checkpoint, catch up on the earlier events
+                self._reconstructor = Reconstructor(
+                    self.socket_time, allow_if_playing_for=0
+                )
+                for ts in sorted(t for t in list(self.events) if t < ct):
+                    self._reconstructor.feed(ts, self.events[ts])
+            media = self._reconstructor.feed_media(ct, {event_name: event_data})
+            if not self.publisher.has_subscribers:
+                return
+            self.publisher.publish(
+                {
+                    "type": "event",
+                    "socket_time": self.socket_time,
+                    "time": ct,
+                    "event": event_name,
+                    "data": event_data,
+                }
+            )
+            for m in media:
+                self.publisher.publish(
+                    {"type": "media", "socket_time": self.socket_time, "media": m}
+                )
 
     def store_initial_metadata(self) -> None:
         self.nevent("socket-added", time())
         self.poll_for_property("working_directory", "working-directory")
         self.poll_for_property("playlist_count", "playlist-count")
         self.poll_for_property("pause", "is-paused")
-        # self.nevent("playlist", clean_playlist(self.socket.playlist))
 
     def poll_for_property(
         self, attr: str, event_name: str, tries: int = 20, create_event: bool = True
@@ -184,18 +395,33 @@ class SocketData:
         if create_event, once it has a non-None value, it sets the value
         with self.nevent
         """
-        for _ in range(tries):
-            if attr == event_name:
-                logger.debug(f"polling for {attr}")
-            else:
-                logger.debug(f"polling for {attr} {event_name}")
+        start = perf_counter()
+        debug = logger.isEnabledFor(logging.DEBUG)
+        for i in range(tries):
+            if debug and (i == 0 or _poll_log_limit.allow(attr)):
+                logger.debug(
+                    "polling for %s (try %d)",
+                    attr if attr == event_name else f"{attr} {event_name}",
+                    i + 1,
+                    extra={
+                        "socket_time": self.socket_time,
+                        "event_name": event_name,
+                        "try": i + 1,
+                    },
+                )
             value = getattr(self.socket, attr)
             if value is not None:
+                if metrics.enabled:
+                    metrics.record_seconds(f"poll.{attr}", perf_counter() - start)
+                    metrics.record(f"poll.{attr}.retries", i, "")
                 if create_event:
                     self.nevent(event_name, value)
                 return value
             sleep(0.1)
         else:
+            if metrics.enabled:
+                metrics.record_seconds(f"poll.{attr}", perf_counter() - start)
+                metrics.record(f"poll.{attr}.retries", tries, "")
             logger.warning(f"{self.socket_loc} Couldn't poll for {event_name}")
 
     def store_file_metadata(self) -> None:
@@ -225,17 +451,108 @@ class SocketData:
         self.poll_for_property("metadata", "metadata")
         self.poll_for_property("duration", "duration")
 
+    def resync(self) -> None:
+        """
+        Called when a session restored from a checkpoint is reattached to its
+        socket. If mpv moved on to another file while the daemon was down,
+        saves the file change like an eof would
+        """
+        playlist_pos = self.socket.playlist_pos
+        path = self.socket.path
+        last_path = next(
+            (
+                e["path"]
+                for _, e in sorted(self.events.items(), reverse=True)
+                if "path" in e
+            ),
+            None,
+        )
+        if (
+            playlist_pos is not None
+            and int(playlist_pos) + 1 == self.playlist_index
+            and path == last_path
+        ):
+            return
+        logger.info(
+            f"{self.socket_loc}: file changed while the daemon was down, saving the new file"
+        )
+        # like final-write for a session which exited while the daemon was down,
+        # there's no way to know when it changed, so end the previous file right
+        # after the last event
+        if self.events:
+            self._event_at = max(self.events) + 0.001
+        self.nevent("eof")
+        if playlist_pos is None or path is None:
+            # nothing is playing
+            return
+        pcount = self.socket.playlist_count
+        if isinstance(pcount, int):
+            self.playlist_count = pcount
+        # incremented back to playlist_pos + 1 in store_file_metadata
+        self.playlist_index = int(playlist_pos)
+        self.store_file_metadata()
+
+    def percent_pos(self) -> Any:
+        """
+        request the current percent-pos from mpv, timing the round-trip if metrics are enabled
+
+        while apply is running, this is what the observer read instead
+        """
+        if self._observed_percent_pos is not None:
+            return self._observed_percent_pos[0]
+        if not metrics.enabled:
+            return self.socket.percent_pos
+        start = perf_counter()
+        pos = self.socket.percent_pos
+        metrics.record_seconds("percent_pos", perf_counter() - start)
+        return pos
+
+    def apply(
+        self,
+        action: str,
+        value: Any,
+        at: float,
+        percent_pos: Optional[Tuple[Any]] = None,
+    ) -> None:
+        """
+        Called by the consumer thread for this socket with what the property
+        observers saw. The first event this creates is timestamped with
+        when mpv notified us (at), not when it was applied, and uses the
+        percent_pos the observer read, if it read one
+        """
+        self._event_at = at
+        self._observed_percent_pos = percent_pos
+        try:
+            if action == "pause":
+                if value:  # item is now paused
+                    self.event_paused()
+                else:
+                    self.event_resumed()
+            elif action == "eof":
+                self.event_eof()
+            elif action == "seek":
+                self.event_seeking()
+            elif action == "playlist":
+                self.event_playlist(value)
+            elif action == "quit":
+                self.nevent("mpv-quit", at)
+            else:
+                logger.warning(f"Unknown action: {action}")
+        finally:
+            self._event_at = None
+            self._observed_percent_pos = None
+
     def event_resumed(self) -> None:
         """
         Called when the media is resumed, also save % in file
         """
-        self.nevent("resumed", {"percent-pos": self.socket.percent_pos})
+        self.nevent("resumed", {"percent-pos": self.percent_pos()})
 
     def event_paused(self) -> None:
         """
         Called when the media is paused, also save % in file
         """
-        self.nevent("paused", {"percent-pos": self.socket.percent_pos})
+        self.nevent("paused", {"percent-pos": self.percent_pos()})
 
     def event_eof(self) -> None:
         """
@@ -255,11 +572,31 @@ class SocketData:
             if not isinstance(e, (ConnectionRefusedError, TimeoutError)):
                 logger.exception(e)
 
+    def event_playlist(self, value: List[Dict]) -> None:
+        """
+        Called when the playlist changes. The first time, saves the whole
+        playlist, after that only what changed
+        """
+        playlist = clean_playlist(value)
+        if self.playlist is None:
+            self.nevent("playlist", playlist)
+        else:
+            delta = playlist_delta(self.playlist, playlist)
+            if delta is None:
+                # its smaller to save the whole thing, e.g. it was shuffled
+                self.nevent("playlist", playlist)
+            elif delta:
+                self.nevent("playlist-delta", delta)
+            else:
+                # mpv also sends the playlist when the current file changes
+                return
+        self.playlist = playlist
+
     def event_seeking(self) -> None:
         """
         Called when the user seeks in the file. Could possibly be called when a file is loaded as well
         """
-        pos = self.socket.percent_pos
+        pos = self.percent_pos()
         if pos is not None and pos < 2:
             # logger.debug("ignoring seek because we just EOFd?")
             pass
@@ -283,16 +620,58 @@ class LoopHandler:
         write_period: Optional[int],
         poll_time: Optional[int] = 10,
         socket_data_cls: Type[SocketData] = SocketData,
+        data_format: DataFormat = "json",
+        checkpoint_period: Optional[int] = None,
+        publisher: Optional[Publisher] = None,
+        max_poll_time: Optional[int] = None,
+        capture_playlist: bool = False,
+        compact_after: Optional[int] = None,
+        compression: CompressionFormat = "gz",
     ):
         self.data_dir: str = data_dir
+        self.data_format = data_format
+        self.publisher = publisher
         self.socket_dir: str = socket_dir
         self.write_period = write_period
         self._socket_dir_path: Path = Path(socket_dir).expanduser().absolute()
         self.sockets: Dict[str, MPV] = {}
         self.socket_data_cls = socket_data_cls
         self.poll_time = poll_time
+        # if set, save playlists (and changes to them) as events
+        self.capture_playlist = capture_playlist
+        # if set, compress event files this many seconds after the last one was
+        # finalized. Starts a while after launch too, for files finalized before then
+        self.compact_after = compact_after
+        self.compression = compression
+        self.compact_at: Optional[float] = (
+            time() + compact_after if compact_after else None
+        )
+        self.compactor: "Optional[subprocess.Popen[bytes]]" = None
+        # while nothing changes, the time between scans doubles up to this
+        self.max_poll_time = max(max_poll_time or 0, poll_time or 0)
+        # how many scans in a row found no new/removed sockets
+        self.idle_scans = 0
         self.socket_data: Dict[str, SocketData] = {}
         self.waiting = threading.Event()
+        self.dump_metrics_requested = False
+        # periodic writes skipped since nothing changed, and the bytes not written
+        self.skipped_writes = 0
+        self.skipped_bytes = 0
+        # observers (which run in the MPV threads) only put what they saw on
+        # a queue for their socket, and a consumer thread for each socket applies
+        # them, so polling one socket after an eof doesn't hold up the others.
+        # lock is only held while events are added or socket_data is written,
+        # so the dicts never change while they're being serialized
+        self.queues: "Dict[str, SimpleQueue[Union[Ingest, threading.Event, None]]]" = {}
+        self._queues_lock = threading.Lock()
+        self.lock = threading.RLock()
+        # if set, how often to checkpoint socket_data, so a restarted daemon can resume
+        self.checkpoint_period = checkpoint_period
+        self.checkpoint_file: Path = checkpoint_path(data_dir)
+        self.checkpoint_at: float = 0
+        self._checkpointed: Any = None
+        if self.checkpoint_period:
+            self.restore_checkpoint()
         self.setup_signal_handler()
         if autostart:
             self.run_loop()
@@ -317,12 +696,26 @@ class LoopHandler:
                     )
                     self.sockets[socket_loc] = new_sock
                     # if the socket gets disconnected for some reason, and we're recreating MPV, *never* overwrite data
+                    # this is also how sessions restored from a checkpoint are reattached
                     if socket_loc in self.socket_data:
-                        self.socket_data[socket_loc].socket = new_sock
+                        sd = self.socket_data[socket_loc]
+                        restored = sd.socket is None
+                        sd.socket = new_sock
+                        if restored:
+                            logger.info(f"{socket_loc}: resuming checkpointed session")
+                            sd.resync()
                     else:
-                        self.socket_data[socket_loc] = self.socket_data_cls(
+                        sd = self.socket_data_cls(
                             new_sock, socket_loc, self.data_dir, self.write_period
                         )
+                        sd.data_format = self.data_format
+                        sd.publisher = self.publisher
+                        sd.lock = self.lock
+                        if self.publisher is not None:
+                            # publish the events saved while initializing
+                            for ct, event in sorted(sd.events.items()):
+                                sd.publish(ct, *next(iter(event.items())))
+                        self.socket_data[socket_loc] = sd
                     self.attach_observers(socket_loc, new_sock)
                     self.debug_internals()
                 else:  # if this socket is already connected, just try to get the path from the socket
@@ -372,12 +765,10 @@ class LoopHandler:
         # to do larger analysis on the dumped data to figure out
         # if EOF next to seek, remove the seek
 
+        # percent-pos is read here, so its the position when this happened
         @sock.property_observer("pause")
         def on_pause(_, value):
-            if value:  # item is now paused
-                socket_data.event_paused()
-            else:
-                socket_data.event_resumed()
+            self.ingest(socket_data, "pause", value, (socket_data.percent_pos(),))
 
         @sock.property_observer("eof-reached")
         def on_eof(_, value):
@@ -388,25 +779,116 @@ class LoopHandler:
                 logger.warning(
                     "Seems that this is supposed to be None; just to signify event? not sure why it isn't"
                 )
-            socket_data.event_eof()
+            self.ingest(socket_data, "eof", value)
 
         @sock.property_observer("seeking")
         def on_seek(_, value):
             if isinstance(value, bool) and value:
-                socket_data.event_seeking()
+                self.ingest(socket_data, "seek", value, (socket_data.percent_pos(),))
+
+        if self.capture_playlist:
+
+            @sock.property_observer("playlist")
+            def on_playlist(_, value):
+                if isinstance(value, list):
+                    self.ingest(socket_data, "playlist", value)
+
+    def ingest(
+        self,
+        socket_data: SocketData,
+        action: str,
+        value: Any,
+        percent_pos: Optional[Tuple[Any]] = None,
+    ) -> None:
+        """
+        queue something an observer saw, returns immediately
+        """
+        rec = Ingest(socket_data, action, value, time(), perf_counter(), percent_pos)
+        self._queue_for(socket_data.socket_loc).put(rec)
+
+    def _queue_for(
+        self, socket_loc: str
+    ) -> "SimpleQueue[Union[Ingest, threading.Event, None]]":
+        """
+        the queue for socket_loc, starting its consumer thread the first time
+        """
+        with self._queues_lock:
+            queue = self.queues.get(socket_loc)
+            if queue is None:
+                queue = self.queues[socket_loc] = SimpleQueue()
+                threading.Thread(
+                    target=self._consume,
+                    args=(queue,),
+                    name=f"ingest {socket_loc}",
+                    daemon=True,
+                ).start()
+            return queue
+
+    def _stop_consumer(self, socket_loc: str) -> None:
+        with self._queues_lock:
+            queue = self.queues.pop(socket_loc, None)
+        if queue is not None:
+            queue.put(None)
+
+    def _consume(
+        self, queue: "SimpleQueue[Union[Ingest, threading.Event, None]]"
+    ) -> None:
+        """
+        a consumer thread, applies the records queued for one socket in order
+        """
+        while True:
+            rec = queue.get()
+            if rec is None:
+                # the socket was written out, nothing else is queued for it
+                return
+            if isinstance(rec, threading.Event):
+                # from flush, everything before this has been applied
+                rec.set()
+                continue
+            if metrics.enabled:
+                metrics.record_seconds(
+                    f"ingest.latency.{rec.action}", perf_counter() - rec.queued
+                )
+            try:
+                rec.socket_data.apply(rec.action, rec.value, rec.at, rec.percent_pos)
+            except Exception as e:
+                logger.exception(e)
+
+    def flush(
+        self, timeout: float = 5, socket_locs: Optional[Sequence[str]] = None
+    ) -> bool:
+        """
+        wait till everything queued so far for socket_locs (default: every
+        socket) has been applied
+        """
+        with self._queues_lock:
+            queues = [
+                q
+                for loc, q in self.queues.items()
+                if socket_locs is None or loc in socket_locs
+            ]
+        events = []
+        for queue in queues:
+            done = threading.Event()
+            queue.put(done)
+            events.append(done)
+        deadline = monotonic() + timeout
+        return all(done.wait(max(deadline - monotonic(), 0)) for done in events)
 
     def remove_socket(self, socket_loc: str) -> None:
         if socket_loc in self.sockets:
             logger.debug(f"Removing socket {socket_loc}")
             # write quit event
             try:
-                self.socket_data[socket_loc].nevent("mpv-quit", time())
+                self.ingest(self.socket_data[socket_loc], "quit", None)
             except KeyError:
                 pass
             try:
                 del self.sockets[socket_loc]
             except KeyError:
                 pass
+            # wake up the main loop, to write the data for this socket
+            self.waiting.set()
         else:
             logger.warning(
                 "called remove socket, but socket_loc doesn't exist in self.sockets"
@@ -414,16 +896,27 @@ class LoopHandler:
         # (doesn't remove the file here, but should find it on the next scan_sockets call and remove it then)
 
     def debug_internals(self) -> None:
-        logger.debug(f"sockets {self.sockets}")
-        logger.debug(f"socket_data {self.socket_data}")
+        if logger.isEnabledFor(logging.DEBUG):
+            logger.debug("sockets %s", self.sockets)
+            logger.debug("socket_data %s", self.socket_data)
 
     def periodic_write(self) -> None:
         now = time()
-        for socket_data in self.socket_data.values():
-            if now > socket_data.write_at:
-                logger.debug(f"{socket_data.socket_time}|running periodic write")
-                socket_data.write()
+        for socket_data in list(self.socket_data.values()):
+            if now >= socket_data.write_at:
                 socket_data.write_at = now + socket_data.write_period
+                if not socket_data.dirty:
+                    logger.debug(
+                        f"{socket_data.socket_time}|no new events, skipping periodic write"
+                    )
+                    self.skipped_writes += 1
+                    self.skipped_bytes += socket_data.written_size
+                    if metrics.enabled:
+                        metrics.record("write.skipped", socket_data.written_size, "B")
+                    continue
+                logger.debug(f"{socket_data.socket_time}|running periodic write")
+                with self.lock:
+                    socket_data.write()
                 self.debug_internals()
 
     def write_data(self, force: bool = False) -> None:
@@ -435,21 +928,141 @@ class LoopHandler:
         # self.socket_data, write that out to data_dir
         #
         # this runs in the main thread... so errors crash main thread
-        for socket_loc in list(self.socket_data):
-            if socket_loc not in self.sockets:
+        finished = [
+            socket_loc
+            for socket_loc, sd in list(self.socket_data.items())
+            if socket_loc not in self.sockets
+            # restored from a checkpoint, but scan_sockets hasn't
+            # reconnected to (or removed the dead) socket yet
+            and not (sd.socket is None and os.path.exists(socket_loc))
+        ]
+        if finished or force:
+            # so the mpv-quit (and anything else still queued) is saved first
+            if not self.flush(
+                timeout=1 if force else 5, socket_locs=None if force else finished
+            ):
+                logger.warning("Timed out waiting for queued events to be applied")
+        with self.lock:
+            for socket_loc in finished:
                 logger.info(f"{socket_loc}: writing to file...")
-                self.socket_data[socket_loc].nevent("final-write", time())
-                self.socket_data[socket_loc].write()
+                sd = self.socket_data[socket_loc]
+                if sd.socket is None and sd.events:
+                    # restored from a checkpoint, but mpv exited while the daemon
+                    # was down. There's no way to know when, so end it right after
+                    # the last event, instead of now (which would count all
+                    # the time the daemon was down as listening time)
+                    ended = max(sd.events) + 0.001
+                    sd._event_at = ended
+                    sd.nevent("final-write", ended)
+                else:
+                    sd.nevent("final-write", time())
+                sd.store_summary()
+                sd.write()
                 del self.socket_data[socket_loc]
+                self._stop_consumer(socket_loc)
+                self.debug_internals()
+            if finished and self.skipped_writes:
+                logger.info(
+                    f"skipped {self.skipped_writes} unchanged periodic writes so far, saving {self.skipped_bytes} bytes"
+                )
+            if finished and self.checkpoint_period:
+                # so a restarted daemon doesn't restore (and rewrite) these
+                self.save_checkpoint()
+            if finished and self.compact_after:
+                # wait for a quiet period again, so files are compacted in bulk
+                self.compact_at = time() + self.compact_after
+            if force:
+                # don't write additional events to the file, just write data
+                # for every socket regardless of state. This is used if the program
+                # is crashing/etc.
+                logger.warning("forcing write to files...")
                 self.debug_internals()
-        if force:
-            # don't write additional events to the file, just write data
-            # for every socket regardless of state. This is used if the program
-            # is crashing/etc.
-            logger.warning("forcing write to files...")
-            self.debug_internals()
-            for socket_data in self.socket_data.values():
-                socket_data.write()
+                for socket_data in self.socket_data.values():
+                    socket_data.write()
+                if self.checkpoint_period:
+                    self.save_checkpoint()
+
+    def restore_checkpoint(self) -> None:
+        """
+        load socket data saved by a previous daemon. Sessions for mpv instances
+        which are still running are reattached by scan_sockets, the rest are
+        written out by write_data, like any other socket which has exited
+        """
+        for socket_loc, state in load_checkpoint(self.checkpoint_file).items():
+            try:
+                sd = self.socket_data_cls.from_checkpoint(
+                    socket_loc, self.data_dir, state
+                )
+            except Exception as e:
+                logger.warning(f"{socket_loc}: could not restore from checkpoint: {e}")
+                continue
+            finalized = finalized_file(Path(self.data_dir), sd.socket_time)
+            if finalized is not None:
+                # written out after the checkpoint was saved
+                logger.info(
+                    f"{socket_loc}: already finalized in {finalized}, not restoring from checkpoint"
+                )
+                continue
+            sd.data_format = self.data_format
+            sd.publisher = self.publisher
+            sd.lock = self.lock
+            self.socket_data[socket_loc] = sd
+            logger.info(
+                f"{socket_loc}: restored {sd.event_count} events from checkpoint"
+            )
+
+    def save_checkpoint(self) -> None:
+        if not self.socket_data:
+            clear_checkpoint(self.checkpoint_file)
+            self._checkpointed = None
+            return
+        start = perf_counter()
+        # events are only ever added, so this changes if anything needs to be saved
+        saved = {
+            loc: (sd.event_count, sd.playlist_index)
+            for loc, sd in self.socket_data.items()
+        }
+        if saved == self._checkpointed:
+            return
+        with self.lock:
+            states = {
+                loc: sd.checkpoint_state() for loc, sd in self.socket_data.items()
+            }
+        size = save_checkpoint(self.checkpoint_file, states)
+        self._checkpointed = saved
+        if metrics.enabled:
+            metrics.record_seconds("checkpoint", perf_counter() - start)
+            metrics.record("checkpoint.size", size, "B")
+
+    def periodic_checkpoint(self) -> None:
+        if not self.checkpoint_period:
+            return
+        now = time()
+        if now >= self.checkpoint_at:
+            self.save_checkpoint()
+            self.checkpoint_at = now + self.checkpoint_period
+
+    def periodic_compact(self) -> None:
+        if self.compactor is not None and self.compactor.poll() is not None:
+            if self.compactor.returncode != 0:
+                logger.warning(
+                    f"compact exited with {self.compactor.returncode}, will retry after the next file is written"
+                )
+            self.compactor = None
+        if self.compact_at is None or time() < self.compact_at:
+            return
+        assert self.compact_after
+        if self.compactor is not None:
+            # still running from last time
+            self.compact_at = time() + self.compact_after
+            return
+        logger.info(f"compacting finalized event files in {self.data_dir}...")
+        self.compact_at = None
+        self.compactor = spawn_compact(
+            self.data_dir,
+            compression=self.compression,
+            quiet_period=self.compact_after,
+        )
 
     def setup_signal_handler(self) -> None:
         # catch the RTMIN signal, which some user defined code might send to this process
@@ -458,41 +1071,95 @@ class LoopHandler:
         # instead of waiting for the next scan_sockets call
 
         signal.signal(signal.SIGRTMIN, self.signal_handler)
+        # if metrics are enabled, SIGUSR1 dumps them to the log
+        if metrics.enabled:
+            signal.signal(signal.SIGUSR1, self.signal_handler)
 
     def signal_handler(self, signum: int, frame: Any) -> None:
         signal_name = signal.Signals(signum).name
         logger.debug(f"Caught signal {signum} {signal_name}, interrupting main loop")
+        if signum == signal.SIGUSR1:
+            self.dump_metrics_requested = True
         self.waiting.set()
 
+    def dump_metrics(self) -> None:
+        self.dump_metrics_requested = False
+        logger.info("metrics:")
+        for line in metrics.summary():
+            logger.info(line)
+        logger.info(
+            f"skipped {self.skipped_writes} unchanged periodic writes, saving {self.skipped_bytes} bytes"
+        )
+
+    def next_deadline(self) -> Optional[float]:
+        """
+        the earliest time a periodic write, checkpoint or compaction is due
+        """
+        deadlines = [sd.write_at for sd in self.socket_data.values()]
+        if self.checkpoint_period and self.socket_data:
+            deadlines.append(self.checkpoint_at)
+        if self.compact_at is not None:
+            deadlines.append(self.compact_at)
+        return min(deadlines, default=None)
+
+    def next_timeout(self) -> Optional[float]:
+        """
+        How long the main loop should wait for. If the socket dir hasn't changed
+        for IDLE_SCANS scans, the time between scans doubles each scan (up to
+        max_poll_time), but never past the next write/checkpoint deadline
+        """
+        timeout: Optional[float] = None
+        if self.poll_time:
+            backoff = max(self.idle_scans - IDLE_SCANS, 0)
+            # cap the exponent, the result is capped anyways
+            timeout = min(self.poll_time * 2 ** min(backoff, 16), self.max_poll_time)
+        deadline = self.next_deadline()
+        if deadline is not None:
+            # a bit after, so the deadline has passed when this wakes up
+            until = max(deadline - time(), 0) + 0.01
+            timeout = until if timeout is None else min(timeout, until)
+        return timeout
+
+    def tick(self, scan: bool = True) -> None:
+        before = set(self.sockets)
+        if scan:
+            self.scan_sockets()
+        deadline = self.next_deadline()
+        if deadline is not None and time() >= deadline:
+            self.periodic_write()
+        self.write_data()
+        self.periodic_checkpoint()
+        self.periodic_compact()
+        if scan:
+            if set(self.sockets) != before:
+                self.idle_scans = 0
+            else:
+                self.idle_scans += 1
+
     def run_loop(self) -> None:
         if self.poll_time:
             logger.debug("Starting mpv-history-daemon loop...")
             logger.debug(f"Using socket class {self.socket_data_cls}")
-            while True:
-                self.scan_sockets()
-                self.periodic_write()
-                self.write_data()
-                was_interrupted = self.waiting.wait(self.poll_time)
-                self.waiting.clear()
-                if was_interrupted is True:
-                    logger.debug(
-                        "mpv-history-daemon got interrupt, checking sockets..."
-                    )
         else:
             logger.warning(
                 "poll time is None, skipping periodic check. You have to manually signal mpv whenever sockets are added or removed or this won't work"
             )
-            while True:
-                # no timeout, just wait forever till the event is set
-                was_interrupted = self.waiting.wait()
-                self.waiting.clear()
-                if was_interrupted is True:
-                    logger.debug(
-                        "mpv-history-daemon got interrupt, checking sockets..."
-                    )
-                    self.scan_sockets()
-                    self.periodic_write()
-                    self.write_data()
+        # when polling is disabled, only scan when signalled
+        scan = bool(self.poll_time)
+        while True:
+            self.tick(scan=scan)
+            timeout = self.next_timeout()
+            if metrics.enabled and timeout is not None:
+                metrics.record_seconds("loop.timeout", timeout)
+            was_interrupted = self.waiting.wait(timeout)
+            self.waiting.clear()
+            if self.dump_metrics_requested:
+                self.dump_metrics()
+            if was_interrupted is True:
+                logger.debug("mpv-history-daemon got interrupt, checking sockets...")
+                # a signal, or a socket exited, so scan at the normal rate again
+                self.idle_scans = 0
+            scan = bool(self.poll_time) or was_interrupted
 
 
 def run(
@@ -502,6 +1169,15 @@ def run(
     write_period: Optional[int],
     socket_data_cls: Type[SocketData],
     poll_time: Optional[int],
+    data_format: DataFormat = "json",
+    enable_metrics: bool = False,
+    log_level: int = logging.DEBUG,
+    checkpoint_period: Optional[int] = 60,
+    publish_socket: Optional[str] = None,
+    max_poll_time: Optional[int] = None,
+    capture_playlist: bool = False,
+    compact_after: Optional[int] = None,
+    compression: CompressionFormat = "gz",
 ) -> None:
     # if the daemon launched before any mpv instances
     if not os.path.exists(socket_dir):
@@ -509,7 +1185,14 @@ def run(
     assert os.path.isdir(socket_dir)
     os.makedirs(data_dir, exist_ok=True)
     assert os.path.isdir(data_dir)
-    logfile(log_file, maxBytes=int(1e7), backupCount=1)
+    loglevel(log_level)
+    logfile(log_file, maxBytes=int(1e7), backupCount=1, loglevel=log_level)
+    if enable_metrics:
+        metrics.enabled = True
+    publisher: Optional[Publisher] = None
+    if publish_socket is not None:
+        publisher = Publisher(publish_socket)
+        atexit.register(publisher.close)
     lh = LoopHandler(
         socket_dir,
         data_dir,
@@ -517,6 +1200,13 @@ def run(
         write_period=write_period,
         socket_data_cls=socket_data_cls,
         poll_time=poll_time,
+        data_format=data_format,
+        checkpoint_period=checkpoint_period,
+        publisher=publisher,
+        max_poll_time=max_poll_time,
+        capture_playlist=capture_playlist,
+        compact_after=compact_after,
+        compression=compression,
     )
     # in case user keyboardinterrupt's or this crashes completely
     # for some reason, write data out to files in-case it hasn't
@@ -5,7 +5,8 @@ Reads the JSON event files and constructs media files
 import os
 import re
 import logging
-from itertools import chain
+import hashlib
+from functools import lru_cache
 from datetime import datetime, timezone
 from pathlib import Path, PurePath
 from typing import (
@@ -24,7 +25,12 @@ from typing import (
 
 from logzero import setup_logger  # type: ignore[import]
 
-from .serialize import parse_json_file
+from . import profiling
+from .interning import Interner
+from .serialize import parse_data_file, parse_data_bytes
+from .reader import read_files, ReadStats
+from .salvage import salvage_bytes, read_file_bytes_partial
+from .stream import STREAM_THRESHOLD, is_merged_file, iter_merged_sessions
 
 # TODO: better logger setup?
 loglevel: int = int(os.environ.get("MPV_HISTORY_EVENTS_LOGLEVEL", logging.INFO))
@@ -84,8 +90,176 @@ class Media(NamedTuple):
 Results = Iterator[Media]
 
 
-def all_history(input_files: Sequence[Path]) -> Results:
-    yield from chain(*map(_parse_history_file, input_files))
+def all_history(
+    input_files: Sequence[Path],
+    *,
+    dedupe: bool = False,
+    workers: Optional[int] = None,
+    read_stats: Optional[ReadStats] = None,
+    salvage: bool = False,
+    stream: Optional[bool] = None,
+    intern: bool = False,
+) -> Results:
+    """
+    if dedupe is True, removes duplicate Media across all the input files,
+    see _global_dedupe
+
+    if workers is set, reads/decompresses files using that many threads,
+    see reader.read_files. read_stats can be passed to collect per-codec
+    throughput for those reads
+
+    if salvage is True, files which fail to parse (e.g. because they were
+    truncated) don't raise an error, instead every complete event before
+    the corruption is recovered, see salvage.py
+
+    if stream is True, merged files are decoded one session at a time, so
+    memory is bounded by the largest session instead of the whole file,
+    see stream.py. By default (None), only merged files larger than
+    STREAM_THRESHOLD are streamed. This doesn't apply when using workers
+
+    if intern is True, identical strings (paths, titles, actions) and metadata
+    are shared between the Media, instead of each having its own copy, which
+    uses a lot less memory if you're keeping them all around. metadata is
+    then an immutable FrozenDict, see interning.py
+    """
+    if dedupe:
+        results = _global_dedupe(
+            input_files,
+            workers=workers,
+            read_stats=read_stats,
+            salvage=salvage,
+            stream=stream,
+        )
+    else:
+        results = _parse_history_files(
+            input_files,
+            workers=workers,
+            read_stats=read_stats,
+            salvage=salvage,
+            stream=stream,
+        )
+    if intern:
+        yield from _interned(results)
+    else:
+        yield from results
+
+
+def _interned(results: Results) -> Results:
+    interner = Interner()
+    s = interner.string
+    for m in results:
+        # positional, since this is a lot faster than keyword arguments
+        yield Media(
+            s(m.path),
+            m.is_stream,
+            m.start_time,
+            m.end_time,
+            m.pause_duration,
+            m.media_duration,
+            interner.optional_string(m.media_title),
+            [Action(a[0], s(a[1]), a[2]) for a in m.actions],
+            interner.mapping(m.metadata),
+        )
+
+
+def _parse_history_files(
+    input_files: Sequence[Path],
+    *,
+    workers: Optional[int] = None,
+    read_stats: Optional[ReadStats] = None,
+    salvage: bool = False,
+    stream: Optional[bool] = None,
+) -> Results:
+    for _, results in _parse_each_history_file(
+        input_files,
+        workers=workers,
+        read_stats=read_stats,
+        salvage=salvage,
+        stream=stream,
+    ):
+        yield from results
+
+
+def _parse_each_history_file(
+    input_files: Sequence[Path],
+    *,
+    workers: Optional[int] = None,
+    read_stats: Optional[ReadStats] = None,
+    salvage: bool = False,
+    stream: Optional[bool] = None,
+) -> Iterator[Tuple[Path, Results]]:
+    """
+    yields each file along with the Media parsed from it, in the order of input_files
+    """
+    if workers is None and read_stats is None:
+        for p in input_files:
+            yield p, _parse_history_file(p, salvage=salvage, stream=stream)
+        return
+    for p, data in read_files(
+        input_files, workers=workers, stats=read_stats, partial=salvage
+    ):
+        event_data = _decode_history_data(p, data, salvage=salvage)
+        del data
+        yield p, _parse_history_data(p, event_data)
+
+
+# Media with the same path whose start times fall in the same bucket are
+# considered to be the same session
+DEDUPE_BUCKET_SECONDS = 10
+
+
+def _dedupe_key(m: Media) -> int:
+    bucket = int(m.start_time.timestamp() // DEDUPE_BUCKET_SECONDS)
+    digest = hashlib.blake2b(
+        f"{bucket}|{m.path}".encode("utf-8", errors="surrogatepass"), digest_size=8
+    ).digest()
+    return int.from_bytes(digest, "little")
+
+
+def _global_dedupe(
+    input_files: Sequence[Path],
+    *,
+    workers: Optional[int] = None,
+    read_stats: Optional[ReadStats] = None,
+    salvage: bool = False,
+    stream: Optional[bool] = None,
+) -> Results:
+    """
+    The same session can appear in multiple files, e.g. in a merged file and
+    the original event file if it wasn't moved after merging
+
+    The first pass keeps a compact index of the best score for each (path,
+    start_time bucket) hash, and which file (and where in that file) it was in.
+    The second pass parses the files again, yielding only those Media, so
+    memory is bounded by the number of unique sessions, not their Media.
+    Positions are per file, and the key is checked again, so a file which
+    changes between passes (e.g. the daemon writing to it) can't cause
+    Media from other files to be kept or dropped
+    """
+    best: Dict[int, Tuple[float, Path, int]] = {}
+    count = 0
+    for p, results in _parse_each_history_file(
+        input_files,
+        workers=workers,
+        read_stats=read_stats,
+        salvage=salvage,
+        stream=stream,
+    ):
+        for i, m in enumerate(results):
+            count += 1
+            key = _dedupe_key(m)
+            # on ties, keep the first one we saw
+            if key not in best or m.score > best[key][0]:
+                best[key] = (m.score, p, i)
+    if count > len(best):
+        logger.debug(f"Removing {count - len(best)} duplicate media across files")
+    for p, results in _parse_each_history_file(
+        input_files, workers=workers, salvage=salvage, stream=stream
+    ):
+        for i, m in enumerate(results):
+            kept = best.get(_dedupe_key(m))
+            if kept is not None and kept[2] == i and kept[1] == p:
+                yield m
 
 
 # use some of the context of what this piece of media
@@ -111,161 +285,496 @@ def _actually_listened_to(m: Media, require_listened_to_percent: float = 0.75) -
 def history(
     input_files: Sequence[Path],
     filter_function: Callable[[Media], bool] = _actually_listened_to,
+    **kwargs: Any,
 ) -> Results:
     """
     can supply a function which accepts a 'Media' object as
     the first argument as the filter function
+
+    any other keyword arguments are passed to all_history
     """
-    yield from filter(filter_function, all_history(input_files))
+    if profiling.current is not None:
+        yield from filter(
+            _profiled_filter(filter_function), all_history(input_files, **kwargs)
+        )
+    else:
+        yield from filter(filter_function, all_history(input_files, **kwargs))
+
+
+def _profiled_filter(
+    filter_function: Callable[[Media], bool],
+) -> Callable[[Media], bool]:
+    def _filter(m: Media) -> bool:
+        with profiling.stage("filter", items=1):
+            return filter_function(m)
+
+    return _filter
 
 
-def _parse_history_file(p: Path) -> Results:
+def _should_stream(p: Path, stream: Optional[bool]) -> bool:
+    if stream is False:
+        return False
+    if stream is None:
+        try:
+            if os.stat(p).st_size < STREAM_THRESHOLD:
+                return False
+        except OSError:
+            return False
+    return is_merged_file(p)
+
+
+def _parse_history_file(
+    p: Path, salvage: bool = False, stream: Optional[bool] = None
+) -> Results:
+    if not salvage and _should_stream(p, stream):
+        sessions = iter_merged_sessions(p)
+        while True:
+            try:
+                name, data = next(sessions)
+            except StopIteration:
+                return
+            except Exception as e:
+                raise Exception(f"Error parsing JSON file {p}") from e
+            yield from _read_media(data, filename=name)
+            # free this session before decoding the next one
+            del data
+    if salvage:
+        data, read_error = read_file_bytes_partial(p)
+        if read_error is not None:
+            logger.warning(f"{p}: {read_error}")
+        event_data = _decode_history_data(p, data, salvage=True)
+    else:
+        try:
+            event_data = parse_data_file(p)
+        except Exception as e:
+            raise Exception(f"Error parsing JSON file {p}") from e
+    yield from _parse_history_data(p, event_data)
+
+
+def _decode_history_data(p: Path, data: bytes, *, salvage: bool) -> Any:
     try:
-        event_data = parse_json_file(p)
+        with profiling.stage("decode"):
+            return parse_data_bytes(data)
     except Exception as e:
-        raise Exception(f"Error parsing JSON file {p}") from e
+        if not salvage:
+            raise Exception(f"Error parsing JSON file {p}") from e
+    res = salvage_bytes(data)
+    logger.warning(f"Error parsing {p}, salvaged: {res.describe()}")
+    return res.data
+
+
+def _parse_history_data(p: Path, event_data: Any) -> Results:
     # mapping signifies this is a merged file, whose key is the old filename
     # and value is the JSON data
     if "mapping" in event_data:
         for name, data in event_data["mapping"].items():
-            yield from _read_event_stream(data, filename=name)
+            yield from _read_media(data, filename=name)
     else:
-        yield from _read_event_stream(event_data, filename=str(p))
+        yield from _read_media(event_data, filename=str(p))
+
+
+def _read_media(events: Any, filename: str) -> List[Media]:
+    with profiling.stage("reconstruct"):
+        media = list(_read_event_stream(events, filename=filename))
+    profiling.count("reconstruct", len(media))
+    return media
 
 
 def _read_event_stream(
     events: Any, filename: str, *, allow_if_playing_for: int = 60
 ) -> Results:
+    summarized = _summarized_media(events, allow_if_playing_for=allow_if_playing_for)
+    if summarized is not None:
+        yield from summarized
+        return
+    for _, m in _best_media(
+        events, filename=filename, allow_if_playing_for=allow_if_playing_for
+    ):
+        yield m
+
+
+def _best_media(
+    events: Any, filename: str, *, allow_if_playing_for: int
+) -> List[Tuple[Dict[str, Any], Media]]:
+    """
+    reconstructs the media in events, along with the data they were created from
+    """
     # if there's a conflict, keep a 'score' by adding non-null fields on an item,
     # and return the one that has the most
     #
     # sometimes youtube-dl will show up twice ...?
     # use 'path' as a primary key to remove possible
     # duplicate event data
-    items: Dict[str, Media] = {}
+    items: Dict[str, Tuple[Dict[str, Any], Media]] = {}
+    debug = logger.isEnabledFor(logging.DEBUG)
     for d in _reconstruct_event_stream(
         events, filename=filename, allow_if_playing_for=allow_if_playing_for
     ):
-        # required keys
-        if not REQUIRED_KEYS.issubset(set(d)):
-            # logger.debug("Doesn't have required keys, ignoring...")
+        m = _media_from_data(d)
+        if m is None:
             continue
-        if d["end_time"] < d["start_time"]:
-            logger.warning(f"End time is less than start time! {d}")
-        fdur: Optional[float] = None
-        if "duration" in d:
-            fdur = float(d["duration"])
-        start_time = parse_datetime_sec(float(d["start_time"]))
-        m = Media(
-            path=d["path"],
-            is_stream=d["is_stream"],
-            start_time=start_time,
-            end_time=parse_datetime_sec(float(d["end_time"])),
-            pause_duration=float(d["pause_duration"]),
-            media_duration=fdur,
-            media_title=d.get("media_title"),
-            actions=[
+        key = m.path
+        if key not in items:
+            items[key] = (d, m)
+        else:
+            # use item with better score
+            if m.score > items[key][1].score:
+                if debug:
+                    logger.debug("replacing %s with %s", items[key][1], m)
+                items[key] = (d, m)
+    return list(items.values())
+
+
+# bump this whenever a change to the Reconstructor (or _best_media) changes the
+# media it returns, so summaries written by older versions of the daemon are ignored
+PARSER_VERSION = 2
+
+
+def summarize(
+    events: Dict[Any, Any], filename: str, *, allow_if_playing_for: int = 60
+) -> Dict[str, Any]:
+    """
+    the media reconstructed from a complete event file. The daemon saves this
+    as the last event in the file (a 'summary'), so parsing the file later
+    can use that instead of reconstructing the media again
+
+    Each media is a row of its fields. Most of those are the data (or the
+    timestamp) of one of the events, so instead of another copy, the row has
+    the index of that event. Those are ints, anything else is the value itself.
+    Relative paths are a list of the path and working-directory event indexes
+    """
+    values = list(events.values())
+
+    def _data_at(name: str) -> Dict[int, int]:
+        # the reconstructor keeps the event data as is, so this finds
+        # the event a value came from by its identity
+        return {id(event[name]): i for i, event in enumerate(values) if name in event}
+
+    paths = _data_at("path")
+    titles = _data_at("media-title")
+    durations = _data_at("duration")
+    metadata_at = _data_at("metadata")
+    event_at = {float(ts): i for i, ts in enumerate(events)}
+    # relative paths are joined with the working directory
+    joined: Dict[str, List[int]] = {}
+    for w, event in enumerate(values):
+        working_dir = event.get("working-directory")
+        if isinstance(working_dir, str):
+            for i in paths.values():
+                rel = values[i]["path"]
+                if isinstance(rel, str):
+                    joined.setdefault(os.path.join(working_dir, rel), [i, w])
+
+    def _data_ref(value: Any, refs: Dict[int, int]) -> Any:
+        return refs.get(id(value), value)
+
+    def _path_ref(path: str) -> Any:
+        ref = paths.get(id(path))
+        if ref is not None:
+            return ref
+        return joined.get(path, path)
+
+    def _time_ref(value: Any) -> Union[int, float]:
+        ts = float(value)
+        return event_at.get(ts, ts)
+
+    rows = []
+    for d, m in _best_media(
+        events, filename=filename, allow_if_playing_for=allow_if_playing_for
+    ):
+        rows.append(
+            [
+                _path_ref(m.path),
+                m.is_stream,
+                _time_ref(d["start_time"]),
+                _time_ref(d["end_time"]),
+                m.pause_duration,
+                _data_ref(m.media_duration, durations),
+                _data_ref(m.media_title, titles),
+                metadata_at[id(d["metadata"])] if "metadata" in d else None,
+                [event_at[ts] for ts in d["actions"]],
+            ]
+        )
+    return {
+        "version": PARSER_VERSION,
+        "events": len(events),
+        "allow_if_playing_for": allow_if_playing_for,
+        "media": rows,
+    }
+
+
+def _summarized_media(events: Any, *, allow_if_playing_for: int) -> Optional[Results]:
+    """
+    the media from the summary at the end of events, if there is one,
+    and it was created by this version of the parser from the same events
+    """
+    if not isinstance(events, dict) or not events:
+        return None
+    last = events[next(reversed(events))]
+    summary = last.get("summary") if isinstance(last, dict) else None
+    if not isinstance(summary, dict):
+        return None
+    if (
+        summary.get("version") != PARSER_VERSION
+        or summary.get("events") != len(events) - 1
+        or summary.get("allow_if_playing_for") != allow_if_playing_for
+    ):
+        return None
+    return _media_from_summary(summary["media"], events)
+
+
+def _media_from_summary(rows: List[List[Any]], events: Dict[Any, Any]) -> Results:
+    timestamps = list(events)
+    values = list(events.values())
+    for (
+        path,
+        is_stream,
+        start_time,
+        end_time,
+        pause_duration,
+        media_duration,
+        media_title,
+        metadata_at,
+        actions,
+    ) in rows:
+        if type(path) is int:
+            path = values[path]["path"]
+        elif isinstance(path, list):
+            path_at, working_dir_at = path
+            path = os.path.join(
+                values[working_dir_at]["working-directory"], values[path_at]["path"]
+            )
+        if type(media_duration) is int:
+            media_duration = values[media_duration]["duration"]
+        if type(media_title) is int:
+            media_title = values[media_title]["media-title"]
+        if type(start_time) is int:
+            start_time = timestamps[start_time]
+        if type(end_time) is int:
+            end_time = timestamps[end_time]
+        started = parse_datetime_sec(start_time)
+        media_actions = []
+        for i in actions:
+            # a seek/paused/resumed event, like in the Reconstructor
+            action, data = next(iter(values[i].items()))
+            media_actions.append(
                 Action(
                     since_started=(
-                        parse_datetime_sec(timestamp) - start_time
+                        parse_datetime_sec(timestamps[i]) - started
                     ).total_seconds(),
-                    action=data[0],
-                    percentage=data[1],
+                    action=action,
+                    percentage=data["percent-pos"],
                 )
-                for timestamp, data in d["actions"].items()
-            ],
-            metadata=d.get("metadata", {}),
+            )
+        yield Media(
+            path=path,
+            is_stream=is_stream,
+            start_time=started,
+            end_time=parse_datetime_sec(end_time),
+            pause_duration=pause_duration,
+            media_duration=media_duration,
+            media_title=media_title,
+            actions=media_actions,
+            metadata={} if metadata_at is None else values[metadata_at]["metadata"],
         )
-        key = m.path
-        if key not in items:
-            items[key] = m
-        else:
-            # use item with better score
-            if m.score > items[key].score:
-                logger.debug(f"replacing {items[key]} with {m}")
-                items[key] = m
-    yield from list(items.values())
 
 
 REQUIRED_KEYS = set(["playlist_pos", "start_time", "path"])
 
+
+def _media_from_data(d: Dict[str, Any]) -> Optional[Media]:
+    """
+    converts the data yielded by _reconstruct_event_stream to Media,
+    returns None if its missing required keys
+    """
+    if not REQUIRED_KEYS.issubset(set(d)):
+        # logger.debug("Doesn't have required keys, ignoring...")
+        return None
+    if d["end_time"] < d["start_time"]:
+        logger.warning(f"End time is less than start time! {d}")
+    fdur: Optional[float] = None
+    if "duration" in d:
+        fdur = float(d["duration"])
+    start_time = parse_datetime_sec(float(d["start_time"]))
+    return Media(
+        path=d["path"],
+        is_stream=d["is_stream"],
+        start_time=start_time,
+        end_time=parse_datetime_sec(float(d["end_time"])),
+        pause_duration=float(d["pause_duration"]),
+        media_duration=fdur,
+        media_title=d.get("media_title"),
+        actions=[
+            Action(
+                since_started=(
+                    parse_datetime_sec(timestamp) - start_time
+                ).total_seconds(),
+                action=data[0],
+                percentage=data[1],
+            )
+            for timestamp, data in d["actions"].items()
+        ],
+        metadata=d.get("metadata", {}),
+    )
+
+
 IGNORED_EVENTS: Set[EventType] = set(
     [
         "playlist",
+        "playlist-delta",
         "playlist-count",
+        "summary",
     ]
 )
 
 
-URL_REGEX = re.compile(
+URL_PATTERN = (
     r"^(?:http|ftp)s?://"  # http:// or https://
     r"(?:(?:[A-Z0-9](?:[A-Z0-9-]{0,61}[A-Z0-9])?\.)+(?:[A-Z]{2,6}\.?|[A-Z0-9-]{2,}\.?)|"  # domain...
     r"localhost|"  # localhost...
     r"\d{1,3}\.\d{1,3}\.\d{1,3}\.\d{1,3})"  # ...or ip
     r"(?::\d+)?"  # optional port
-    r"(?:/?|[/?]\S+)$",
-    re.IGNORECASE,
+    r"(?:/?|[/?]\S+)$"
 )
 
 
+# compiled on first use, rather than when this module is imported
+@lru_cache(maxsize=None)
+def _url_regex() -> "re.Pattern[str]":
+    return re.compile(URL_PATTERN, re.IGNORECASE)
+
+
+def __getattr__(name: str) -> Any:
+    # URL_REGEX used to be compiled at import time, keep it accessible
+    if name == "URL_REGEX":
+        return _url_regex()
+    raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
+
+
 # https://stackoverflow.com/a/7160778/9348376
 def _is_urlish(url: str) -> bool:
-    return re.match(URL_REGEX, url) is not None
+    return _url_regex().match(url) is not None
 
 
 homedir = os.path.expanduser("~")
 
 
-def _reconstruct_event_stream(
-    events: Any, filename: str, *, allow_if_playing_for: int
-) -> Iterator[Dict[str, Any]]:
+class Reconstructor:
     """
     Takes about a dozen events received chronologically from the MPV
     socket, and reconstructs what I was doing while it was playing.
+
+    This is fed one event at a time, returning the data for any media
+    that event completed, so it can be used while mpv is still running
+    (by the daemon) as well as on a complete event file (_reconstruct_event_stream)
+
+    The state can be saved with state() and restored with from_state(),
+    to continue from the last event fed without replaying the earlier ones
     """
-    # mpv socket names are created like:
-    #
-    # declare -a mpv_options
-    # mpv_options=(--input-ipc-server="${socket_dir}/$(date +%s%N)")
-    # exec "$mpv_path" "${mpv_options[@]}"
-    #
-    # get when mpv launched from the filename
-    start_time: Optional[float] = None
-    try:
-        start_time = float(int(PurePath(filename).stem) / 1e9)
-    except ValueError as ve:
-        logger.warning(str(ve))
-        logger.warning("Using 'socket-added' event time instead of filename")
 
-    # dictionary for storing data while we parse though events
-    media_data: Dict[str, Any] = {}
+    # attributes which make up the state, see state()/from_state()
+    _state_attrs = (
+        "filename",
+        "allow_if_playing_for",
+        "start_time",
+        "media_data",
+        "working_dir",
+        "is_first_item",
+        "most_recent_time",
+        "is_playing",
+        "pause_duration",
+        "pause_start_time",
+        "actions",
+        "seen_pause_event",
+        "done",
+    )
 
-    # 'globals', set at the beginning
-    working_dir = homedir
-    is_first_item = True  # helps control how to handle duration
-    # playlist_count = None
-    most_recent_time: float = 0.0
+    def __init__(self, filename: str, *, allow_if_playing_for: int) -> None:
+        self.filename = filename
+        self.allow_if_playing_for = allow_if_playing_for
+        # mpv socket names are created like:
+        #
+        # declare -a mpv_options
+        # mpv_options=(--input-ipc-server="${socket_dir}/$(date +%s%N)")
+        # exec "$mpv_path" "${mpv_options[@]}"
+        #
+        # get when mpv launched from the filename
+        self.start_time: Optional[float] = None
+        try:
+            # strip all extensions, this may be a compressed file like 1611383220380934268.json.gz
+            self.start_time = float(int(PurePath(filename).name.split(".")[0]) / 1e9)
+        except ValueError as ve:
+            logger.warning(str(ve))
+            logger.warning("Using 'socket-added' event time instead of filename")
 
-    # used to help determine state
-    is_playing = True  # assume playing at beginning
-    pause_duration = 0.0  # pause duration for this entry
-    pause_start_time: Optional[float] = None  # if the entry is paused, when it started
-    actions: Dict[float, Tuple[str, float]] = {}
+        # dictionary for storing data while we parse though events
+        self.media_data: Dict[str, Any] = {}
 
-    # a heuristic to determine if this is an old file, is-paused can be useful
-    # to help dedupe incorrect 'resumed' events that happen when a socket first connects
-    seen_pause_event = False
+        # 'globals', set at the beginning
+        self.working_dir = homedir
+        self.is_first_item = True  # helps control how to handle duration
+        # playlist_count = None
+        self.most_recent_time: float = 0.0
 
-    logger.debug(f"Reading events from {filename}")
+        # used to help determine state
+        self.is_playing = True  # assume playing at beginning
+        self.pause_duration = 0.0  # pause duration for this entry
+        # if the entry is paused, when it started
+        self.pause_start_time: Optional[float] = None
+        self.actions: Dict[float, Tuple[str, float]] = {}
 
-    # sort by timestamp, in case
-    for dt_s in sorted(events):
+        # a heuristic to determine if this is an old file, is-paused can be useful
+        # to help dedupe incorrect 'resumed' events that happen when a socket first connects
+        self.seen_pause_event = False
+
+        # set once mpv quits, any events after that are ignored
+        self.done = False
+
+        # checked once, so formatting debug messages costs nothing in feed
+        # if debug logging is disabled
+        self.debug = logger.isEnabledFor(logging.DEBUG)
+        if self.debug:
+            logger.debug("Reading events from %s", filename)
+
+    def state(self) -> Dict[str, Any]:
+        """
+        the state of the reconstructor, can be serialized as JSON/msgpack
+        """
+        state = {attr: getattr(self, attr) for attr in self._state_attrs}
+        state["media_data"] = dict(self.media_data)
+        state["actions"] = [[ts, list(act)] for ts, act in self.actions.items()]
+        return state
+
+    @classmethod
+    def from_state(cls, state: Dict[str, Any]) -> "Reconstructor":
+        r = cls.__new__(cls)
+        for attr in cls._state_attrs:
+            setattr(r, attr, state[attr])
+        r.media_data = dict(state["media_data"])
+        if "actions" in r.media_data:
+            r.media_data["actions"] = {
+                float(ts): tuple(act) for ts, act in r.media_data["actions"].items()
+            }
+        r.actions = {float(ts): (act[0], act[1]) for ts, act in state["actions"]}
+        r.debug = logger.isEnabledFor(logging.DEBUG)
+        return r
+
+    def feed(
+        self, dt_s: Any, event: Dict[EventType, EventData]
+    ) -> Tuple[Dict[str, Any], ...]:
+        """
+        process the next event, returns data for any media which it completed
+        """
+        if self.done:
+            return ()
+        debug = self.debug
         dt_float = float(dt_s)
-        most_recent_time = dt_float
+        self.most_recent_time = dt_float
         # the value is a dictionary of event_name (str) -> event_data (depends on the event)
-        event_name, event_data = next(iter(events[dt_s].items()))
+        event_name, event_data = next(iter(event.items()))
+        media_data = self.media_data
         if event_name in IGNORED_EVENTS:
-            continue
+            pass
         elif event_name == "playlist-pos":
             # reliable event to use to set start time of an item
             # the first item might have been off for 5 or so seconds
@@ -279,48 +788,51 @@ def _reconstruct_event_stream(
                 "playlist_pos" in media_data
                 and media_data["playlist_pos"] == event_data
             ):
-                logger.debug(
-                    f"Got same playlist position {event_data} twice. Current data: {media_data}"
-                )
-                continue
+                if debug:
+                    logger.debug(
+                        "Got same playlist position %s twice. Current data: %s",
+                        event_data,
+                        media_data,
+                    )
+                return ()
             media_data["playlist_pos"] = event_data
-            if is_first_item:
+            if self.is_first_item:
                 # if this is the first item, set the start time to when mpv launched
-                media_data["start_time"] = start_time
-                is_first_item = False  # stays false the entire function call
+                media_data["start_time"] = self.start_time
+                self.is_first_item = False  # stays false for the rest of the events
             else:
                 media_data["start_time"] = dt_float
         elif event_name == "socket-added":
-            if start_time is None:
-                start_time = int(float(event_data))
+            if self.start_time is None:
+                self.start_time = int(float(event_data))
         elif event_name == "working-directory":
             # shouldn't be added to media_data, affects path, but is the
             # same across the entire run of mpv
-            working_dir = event_data
+            self.working_dir = event_data
         elif event_name == "is-paused":
-            seen_pause_event = True  # sets true for this entire file
+            self.seen_pause_event = True  # sets true for this entire file
             # if this was paused when we connected to the socket,
             # assume its been paused since close to it was launched
             if event_data is True:
-                is_playing = False
-                pause_start_time = start_time
+                self.is_playing = False
+                self.pause_start_time = self.start_time
         elif event_name == "path":
             media_data["is_stream"] = False
             # if its ytdl://scheme
             if event_data.startswith("ytdl://"):
                 media_data[event_name] = event_data.lstrip("ytdl://")
                 media_data["is_stream"] = True
-                continue
+                return ()
             if _is_urlish(event_data):
                 media_data[event_name] = event_data
                 media_data["is_stream"] = True
-                continue
+                return ()
             # test if this is an absolute path
             if event_data.startswith("/"):
                 media_data[event_name] = event_data
             else:
                 # I think this is fine to do?
-                full_path: str = os.path.join(working_dir, event_data)
+                full_path: str = os.path.join(self.working_dir, event_data)
                 media_data[event_name] = full_path
         elif event_name == "metadata":
             # TODO: how to parse this better?
@@ -335,22 +847,26 @@ def _reconstruct_event_stream(
             if event_data is not None and "percent-pos" in event_data:
                 assert event_name in ["seek", "resumed", "paused"]
                 if event_name in ["seek", "paused"]:
-                    actions[dt_float] = (event_name, event_data["percent-pos"])
+                    self.actions[dt_float] = (event_name, event_data["percent-pos"])
                 else:
                     assert event_name == "resumed"
-                    if seen_pause_event:
+                    if self.seen_pause_event:
                         # this is a newer file which has the is-paused event, so the only action we should ignore is
                         # the 'resumed' event that happens when a socket first connects,
                         # if the file was already not playing
-                        if is_playing and len(actions) == 0:
+                        if self.is_playing and len(self.actions) == 0:
                             # the user hasn't pasued/played since actions is 0, so this must be the resumed event that
                             # happens when a socket first connects. And since it is not paused and we've seen a pause event,
                             # we are sure that the media is already playing
-                            logger.debug(
-                                "We've seen an is-paused event and the file is already playing, ignoring resume event"
-                            )
+                            if debug:
+                                logger.debug(
+                                    "We've seen an is-paused event and the file is already playing, ignoring resume event"
+                                )
                         else:
-                            actions[dt_float] = (event_name, event_data["percent-pos"])
+                            self.actions[dt_float] = (
+                                event_name,
+                                event_data["percent-pos"],
+                            )
 
                     else:
                         # NOTE: there's a lot of logic here, but its mostly just for myself
@@ -368,10 +884,10 @@ def _reconstruct_event_stream(
                         # if it wasn't, then this is a resume event that happened after the file was paused
                         # so we should add it to the actions
                         if (
-                            start_time is not None
-                            and dt_float - start_time <= 20
-                            and is_playing
-                            and len(actions) == 0
+                            self.start_time is not None
+                            and dt_float - self.start_time <= 20
+                            and self.is_playing
+                            and len(self.actions) == 0
                         ):
                             # this was in the first 10 seconds of the file, and its already playing, so
                             # lets assume this is the 'resumed' event that happens when a socket first connects
@@ -379,9 +895,10 @@ def _reconstruct_event_stream(
                             #
                             # this should be fine anyways, as its just the action we're ignoring here, the file
                             # is already playing and we received a resume event, so we are not changing the state
-                            logger.debug(
-                                "Ignoring resume event in the first 20 seconds of the file while we are already playing, we can't know if this is a real resume event or not"
-                            )
+                            if debug:
+                                logger.debug(
+                                    "Ignoring resume event in the first 20 seconds of the file while we are already playing, we can't know if this is a real resume event or not"
+                                )
                         else:
                             # this might have also been a case in which mpv was already playing and you started the daemon afterwards
                             # if playlist position is higher than 0, then this was probably already paused mpv connected (but this is an old file)
@@ -390,76 +907,124 @@ def _reconstruct_event_stream(
                             # so, lets just yield it in this case, since it was probably real
                             #
                             # it could also just be an old file, and we're resuming after a pause. i.e. the normal case
-                            actions[dt_float] = (event_name, event_data["percent-pos"])
+                            self.actions[dt_float] = (
+                                event_name,
+                                event_data["percent-pos"],
+                            )
 
             if event_name == "paused":
                 # if a pause event was received while mpv was still playing,
                 # save when it was paused, we can calculate complete pause time
                 # while this piece of media was playing by combining sequences of
                 # pause times
-                if is_playing:
-                    is_playing = False
-                    pause_start_time = dt_float
+                if self.is_playing:
+                    self.is_playing = False
+                    self.pause_start_time = dt_float
             elif event_name == "resumed":
                 # if its currently paused, and we received a resume event
-                if not is_playing:
-                    is_playing = True
+                if not self.is_playing:
+                    self.is_playing = True
                     # if we know when it was paused, add how long it was paused to pause_duration
                     # otherwise, we can't know if it had started paused before the daemon connected to the socket
-                    if pause_start_time is not None:
-                        pause_duration = pause_duration + (dt_float - pause_start_time)
-                        pause_start_time = None
+                    if self.pause_start_time is not None:
+                        self.pause_duration = self.pause_duration + (
+                            dt_float - self.pause_start_time
+                        )
+                        self.pause_start_time = None
         elif event_name == "eof":
             # eof is *ALWAYS* before new data gets loaded in
             # if mpv is force quit, may not have an eof.
             # check after to make sure eof/mpv-quit/final-write
             # was the last item, else write out whatever
             # media_data has in the dict currently
-            if not is_playing:
-                pause_duration = pause_duration + (dt_float - pause_start_time)  # type: ignore[operator]
+            if not self.is_playing:
+                self.pause_duration = self.pause_duration + (dt_float - self.pause_start_time)  # type: ignore[operator]
             media_data["end_time"] = dt_float
-            media_data["pause_duration"] = pause_duration
-            media_data["actions"] = actions
-            pause_duration = 0
-            yield media_data
-            media_data = {}
-            actions = {}
+            media_data["pause_duration"] = self.pause_duration
+            media_data["actions"] = self.actions
+            self.pause_duration = 0
+            self.media_data = {}
+            self.actions = {}
+            return (media_data,)
         elif event_name in ["mpv-quit", "final-write"]:
             # if this happened right after an eof, it can be ignored
+            self.done = True
 
             # if the eof didn't happen and mpv was quit manually, save
             # quit time as end_time
             if REQUIRED_KEYS.issubset(set(media_data)):
                 # if I quit while it was paused
-                if not is_playing and pause_start_time is not None:
-                    pause_duration = pause_duration + (dt_float - pause_start_time)
+                if not self.is_playing and self.pause_start_time is not None:
+                    self.pause_duration = self.pause_duration + (
+                        dt_float - self.pause_start_time
+                    )
                 media_data["end_time"] = dt_float
-                media_data["pause_duration"] = pause_duration
-                media_data["actions"] = actions
-                yield media_data
-            return
+                media_data["pause_duration"] = self.pause_duration
+                media_data["actions"] = self.actions
+                return (media_data,)
         else:
             logger.warning(f"Unexpected event name {event_name}")
+        return ()
 
-    if len(media_data) != 0:
-        # if we have enough of the fields in the namedtuple, then this isn't
-        # a corrupted file, its one that didn't have an eof/had events
-        # after an eof for some reason
-        if not REQUIRED_KEYS.issubset(set(media_data)):
-            logger.debug("Ignoring leftover data... {}".format(media_data))
-        else:
-            # if we got through all the keys, and this has been playing for at least a minute (or allow_if_playing_for)
-            # even though this is sorta broken, log it anyways
-            if most_recent_time - int(media_data["start_time"]) > allow_if_playing_for:
-                # if it crashed while it was paused
-                if not is_playing and pause_start_time is not None:
-                    pause_duration = pause_duration + (
-                        most_recent_time - pause_start_time
-                    )
-                logger.debug(
-                    "slightly broken, but yielding anyways... {}".format(media_data)
-                )
-                media_data["end_time"] = most_recent_time
-                media_data["pause_duration"] = pause_duration
-                media_data["actions"] = actions
-                yield media_data
+    def finish(self) -> Tuple[Dict[str, Any], ...]:
+        """
+        called after the last event, returns the media which was still
+        playing, if it looks like it was actually being played
+        """
+        if self.done:
+            return ()
+        self.done = True
+        media_data = self.media_data
+        if len(media_data) != 0:
+            # if we have enough of the fields in the namedtuple, then this isn't
+            # a corrupted file, its one that didn't have an eof/had events
+            # after an eof for some reason
+            if not REQUIRED_KEYS.issubset(set(media_data)):
+                if self.debug:
+                    logger.debug("Ignoring leftover data... %s", media_data)
+            else:
+                # if we got through all the keys, and this has been playing for at least a minute (or allow_if_playing_for)
+                # even though this is sorta broken, log it anyways
+                if (
+                    self.most_recent_time - int(media_data["start_time"])
+                    > self.allow_if_playing_for
+                ):
+                    # if it crashed while it was paused
+                    if not self.is_playing and self.pause_start_time is not None:
+                        self.pause_duration = self.pause_duration + (
+                            self.most_recent_time - self.pause_start_time
+                        )
+                    if self.debug:
+                        logger.debug(
+                            "slightly broken, but yielding anyways... %s", media_data
+                        )
+                    media_data["end_time"] = self.most_recent_time
+                    media_data["pause_duration"] = self.pause_duration
+                    media_data["actions"] = self.actions
+                    return (media_data,)
+        return ()
+
+    def feed_media(self, dt_s: Any, event: Dict[EventType, EventData]) -> List[Media]:
+        """
+        like feed, but converts the completed data to Media
+        """
+        return [
+            m for m in map(_media_from_data, self.feed(dt_s, event)) if m is not None
+        ]
+
+
+def _reconstruct_event_stream(
+    events: Any, filename: str, *, allow_if_playing_for: int
+) -> Iterator[Dict[str, Any]]:
+    """
+    reconstructs media from a complete event file, see Reconstructor
+    """
+    r = Reconstructor(filename, allow_if_playing_for=allow_if_playing_for)
+    # sort by timestamp, in case
+    for dt_s in sorted(events):
+        completed = r.feed(dt_s, events[dt_s])
+        if completed:
+            yield from completed
+        if r.done:
+            return
+    yield from r.finish()
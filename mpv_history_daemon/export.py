@@ -0,0 +1,190 @@
+"""
+Exports Media to Parquet or Arrow IPC files, for analysis with pandas/DuckDB/polars
+
+Each row is one Media, with typed columns (times are UTC timestamps,
+durations are in seconds). actions are a nested list of structs, the
+common metadata tags are flattened into their own columns, and the
+rest of the metadata is kept as a map of strings
+
+Media are written in batches (row groups for Parquet, record batches for
+Arrow), so memory is bounded by the batch size. Requires pyarrow
+"""
+
+import os
+from pathlib import Path
+from typing import Any, Dict, Iterable, Iterator, List, Literal, Optional
+
+from .events import Media
+
+ExportFormat = Literal["parquet", "arrow"]
+EXPORT_FORMATS = ("parquet", "arrow")
+
+# Media in each row group/record batch
+BATCH_SIZE = 10_000
+
+# metadata tags which get their own column. mpv uses different cases
+# depending on the container (e.g. ARTIST for flac), so these are
+# matched case-insensitively
+COMMON_TAGS = ("title", "artist", "album", "album_artist", "genre", "date", "track")
+
+
+def get_pyarrow() -> Any:
+    """
+    imports pyarrow, only once it's needed
+    """
+    try:
+        import pyarrow  # type: ignore[import]
+    except ImportError:
+        raise RuntimeError(
+            "pyarrow is not installed, install it with 'pip install mpv_history_daemon[export]' to export history"
+        )
+    return pyarrow
+
+
+def format_for(output: Path) -> ExportFormat:
+    """
+    guesses the format from the file extension, defaulting to parquet
+    """
+    if output.suffix.lower() in (".arrow", ".feather", ".ipc"):
+        return "arrow"
+    return "parquet"
+
+
+def schema() -> Any:
+    pa = get_pyarrow()
+    ts = pa.timestamp("us", tz="UTC")
+    action = pa.struct(
+        [
+            ("since_started", pa.float64()),
+            ("action", pa.string()),
+            ("percentage", pa.float64()),
+        ]
+    )
+    return pa.schema(
+        [
+            ("path", pa.string()),
+            ("is_stream", pa.bool_()),
+            ("start_time", ts),
+            ("end_time", ts),
+            ("listen_time", pa.float64()),
+            ("pause_duration", pa.float64()),
+            ("media_duration", pa.float64()),
+            ("media_title", pa.string()),
+            *((tag, pa.string()) for tag in COMMON_TAGS),
+            ("actions", pa.list_(action)),
+            ("metadata", pa.map_(pa.string(), pa.string())),
+        ]
+    )
+
+
+def _batches(media: Iterable[Media], batch_size: int) -> Iterator[List[Media]]:
+    batch: List[Media] = []
+    for m in media:
+        batch.append(m)
+        if len(batch) >= batch_size:
+            yield batch
+            batch = []
+    if batch:
+        yield batch
+
+
+def _record_batch(batch: List[Media], sch: Any) -> Any:
+    pa = get_pyarrow()
+    tags: Dict[str, List[Optional[str]]] = {tag: [] for tag in COMMON_TAGS}
+    # actions and metadata are built as flat arrays with offsets, which is
+    # a lot faster than letting pyarrow convert lists of dicts
+    action_offsets = [0]
+    since_started: List[float] = []
+    action_names: List[str] = []
+    percentages: List[Optional[float]] = []
+    meta_offsets = [0]
+    meta_keys: List[str] = []
+    meta_values: List[Optional[str]] = []
+    for m in batch:
+        for a in m.actions:
+            since_started.append(a.since_started)
+            action_names.append(a.action)
+            percentages.append(a.percentage)
+        action_offsets.append(len(since_started))
+        lowered: Dict[str, Any] = {}
+        for k, v in m.metadata.items():
+            meta_keys.append(k)
+            meta_values.append(None if v is None else str(v))
+            lowered.setdefault(k.lower(), v)
+        meta_offsets.append(len(meta_keys))
+        for tag, col in tags.items():
+            v = lowered.get(tag)
+            col.append(None if v is None else str(v))
+    action_type = sch.field("actions").type.value_type
+    actions = pa.ListArray.from_arrays(
+        pa.array(action_offsets, pa.int32()),
+        pa.StructArray.from_arrays(
+            [
+                pa.array(since_started, pa.float64()),
+                pa.array(action_names, pa.string()),
+                pa.array(percentages, pa.float64()),
+            ],
+            fields=list(action_type),
+        ),
+    )
+    metadata = pa.MapArray.from_arrays(
+        pa.array(meta_offsets, pa.int32()),
+        pa.array(meta_keys, pa.string()),
+        pa.array(meta_values, pa.string()),
+    )
+    ts = sch.field("start_time").type
+    columns = [
+        pa.array([m.path for m in batch], pa.string()),
+        pa.array([m.is_stream for m in batch], pa.bool_()),
+        pa.array([m.start_time for m in batch], ts),
+        pa.array([m.end_time for m in batch], ts),
+        pa.array([m.listen_time for m in batch], pa.float64()),
+        pa.array([m.pause_duration for m in batch], pa.float64()),
+        pa.array([m.media_duration for m in batch], pa.float64()),
+        pa.array([m.media_title for m in batch], pa.string()),
+        *(pa.array(tags[tag], pa.string()) for tag in COMMON_TAGS),
+        actions,
+        metadata,
+    ]
+    return pa.RecordBatch.from_arrays(columns, schema=sch)
+
+
+def export_history(
+    media: Iterable[Media],
+    output: Path,
+    *,
+    export_format: Optional[ExportFormat] = None,
+    batch_size: int = BATCH_SIZE,
+) -> int:
+    """
+    writes media to output, returns how many were written. If export_format
+    isn't given, its guessed from the extension. The file is written
+    to a temporary file, and moved to output once its complete
+    """
+    pa = get_pyarrow()
+    if export_format is None:
+        export_format = format_for(output)
+    if export_format not in EXPORT_FORMATS:
+        raise ValueError(
+            f"Unknown format {export_format}, expected one of {EXPORT_FORMATS}"
+        )
+    sch = schema()
+    tmp = output.with_name(f".{output.name}.tmp")
+    count = 0
+    writer: Any
+    if export_format == "parquet":
+        import pyarrow.parquet as pq  # type: ignore[import]
+
+        writer = pq.ParquetWriter(str(tmp), sch)
+    else:
+        writer = pa.ipc.new_file(str(tmp), sch)
+    try:
+        with writer:
+            for batch in _batches(media, batch_size):
+                writer.write_batch(_record_batch(batch, sch))
+                count += len(batch)
+    except BaseException:
+        tmp.unlink(missing_ok=True)
+        raise
+    os.replace(tmp, output)
+    return count
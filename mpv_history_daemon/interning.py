@@ -0,0 +1,86 @@
+"""
+Shares identical strings and metadata between parsed Media
+
+Across years of history, the same paths, titles and metadata (artist/album/title
+tags) appear in thousands of Media, but each is a separate copy from the JSON
+decoder. An Interner keeps the first copy of each, and returns that for any
+equal value after that, so the duplicates can be freed
+
+Shared metadata is a FrozenDict, since changing it would change it for
+every Media which shares it
+"""
+
+from typing import Any, Dict, Hashable, NoReturn, Optional, Tuple
+
+
+class FrozenDict(Dict[str, Any]):
+    """
+    a dict which can't be modified (and so, can be hashed)
+    """
+
+    __slots__ = ("_hash",)
+
+    def _immutable(self, *args: Any, **kwargs: Any) -> NoReturn:
+        raise TypeError(f"{self.__class__.__name__} is immutable")
+
+    __setitem__ = __delitem__ = _immutable
+    clear = pop = popitem = setdefault = update = _immutable  # type: ignore[assignment]
+    __ior__ = _immutable  # type: ignore[assignment]
+
+    def __hash__(self) -> int:  # type: ignore[override]
+        try:
+            return self._hash
+        except AttributeError:
+            self._hash: int = hash(frozenset(self.items()))
+            return self._hash
+
+    def __reduce__(self) -> Tuple[Any, ...]:
+        # dict pickling would call __setitem__
+        return (self.__class__, (dict(self),))
+
+    def __repr__(self) -> str:
+        return f"{self.__class__.__name__}({dict.__repr__(self)})"
+
+
+_EMPTY = FrozenDict()
+
+
+class Interner:
+    """
+    keeps one copy of each string/mapping it has seen. Use one
+    for everything parsed together, and drop it when done
+    """
+
+    def __init__(self) -> None:
+        self._strings: Dict[str, str] = {}
+        self._mappings: Dict[Tuple[Tuple[str, Hashable], ...], FrozenDict] = {}
+
+    def string(self, s: str) -> str:
+        return self._strings.setdefault(s, s)
+
+    def optional_string(self, s: Optional[str]) -> Optional[str]:
+        return None if s is None else self._strings.setdefault(s, s)
+
+    def mapping(self, d: Dict[str, Any]) -> Dict[str, Any]:
+        """
+        returns a shared FrozenDict equal to d. If any of the values
+        aren't hashable, d is returned as is
+        """
+        if not d:
+            return _EMPTY
+        key = tuple(d.items())
+        try:
+            shared = self._mappings.get(key)
+        except TypeError:
+            return d
+        if shared is None:
+            strings = self._strings
+            shared = FrozenDict(
+                (
+                    strings.setdefault(k, k),
+                    strings.setdefault(v, v) if type(v) is str else v,
+                )
+                for k, v in key
+            )
+            self._mappings[tuple(shared.items())] = shared
+        return shared
@@ -3,7 +3,7 @@ from pathlib import Path
 from typing import List, Any, Dict, NamedTuple
 
 from .events import logger
-from .serialize import parse_json_file
+from .serialize import parse_data_file
 
 
 def _is_merged_data(data: Dict[Any, Any]) -> bool:
@@ -27,7 +27,7 @@ def merge_files(files: List[Path], mtime_seconds_since: int = 3600) -> MergeResu
     event_files: List[Path] = []
     consumed_files: List[Path] = []
     for f in files:
-        data = parse_json_file(f)
+        data = parse_data_file(f)
         if _is_merged_data(data):
             merged_files[f] = data
         else:
@@ -48,7 +48,7 @@ def merge_files(files: List[Path], mtime_seconds_since: int = 3600) -> MergeResu
 
     # merge event files
     for event_f in event_files:
-        event_data = parse_json_file(event_f)
+        event_data = parse_data_file(event_f)
         assert "mapping" not in event_data
         merged[event_f.name] = event_data
         consumed_files.append(event_f)
@@ -57,3 +57,16 @@ def merge_files(files: List[Path], mtime_seconds_since: int = 3600) -> MergeResu
         merged_data={"mapping": dict(sorted(merged.items()))},
         consumed_files=consumed_files,
     )
+
+
+def float_timestamp_keys(merged_data: Dict[str, Any]) -> Dict[str, Any]:
+    """
+    JSON event files have their timestamps stringified, this converts
+    them back to floats, for formats which can store them natively
+    """
+    return {
+        "mapping": {
+            name: {float(ts): event for ts, event in events.items()}
+            for name, events in merged_data["mapping"].items()
+        }
+    }
@@ -0,0 +1,90 @@
+"""
+In-memory latency/size histograms for the daemon hot paths
+
+Disabled by default; SocketData checks metrics.enabled before timing
+anything, so the only cost when disabled is an attribute lookup.
+When enabled (daemon --metrics), histograms can be dumped to the
+log by sending the daemon SIGUSR1
+"""
+
+import threading
+from typing import Dict, List, Optional
+
+enabled: bool = False
+
+
+class Histogram:
+    """
+    A histogram with power-of-2 buckets, bucket i counts values in [2^(i-1), 2^i)
+
+    Values are recorded as integers in some unit (e.g. microseconds, bytes),
+    so recording is just a bit_length and an increment
+    """
+
+    def __init__(self, unit: str) -> None:
+        self.unit = unit
+        self.buckets: List[int] = [0] * 64
+        self.count = 0
+        self.total = 0
+        self.max = 0
+        self._lock = threading.Lock()
+
+    def record(self, value: int) -> None:
+        if value < 0:
+            value = 0
+        with self._lock:
+            self.buckets[min(value.bit_length(), 63)] += 1
+            self.count += 1
+            self.total += value
+            if value > self.max:
+                self.max = value
+
+    def percentile(self, pct: float) -> int:
+        """
+        upper bound of the bucket which contains the given percentile
+        """
+        if self.count == 0:
+            return 0
+        target = self.count * pct / 100
+        seen = 0
+        for i, n in enumerate(self.buckets):
+            seen += n
+            if seen >= target:
+                return min((1 << i) - 1 if i > 0 else 0, self.max)
+        return self.max
+
+    def describe(self) -> str:
+        if self.count == 0:
+            return "no data"
+        mean = self.total / self.count
+        return f"n={self.count} mean={mean:.0f}{self.unit} p50<={self.percentile(50)}{self.unit} p90<={self.percentile(90)}{self.unit} p99<={self.percentile(99)}{self.unit} max={self.max}{self.unit}"
+
+
+_histograms: Dict[str, Histogram] = {}
+_registry_lock = threading.Lock()
+
+
+def histogram(name: str, unit: str = "us") -> Histogram:
+    hist: Optional[Histogram] = _histograms.get(name)
+    if hist is None:
+        with _registry_lock:
+            hist = _histograms.setdefault(name, Histogram(unit))
+    return hist
+
+
+def record_seconds(name: str, seconds: float) -> None:
+    """record a duration, in microseconds"""
+    histogram(name, "us").record(int(seconds * 1e6))
+
+
+def record(name: str, value: int, unit: str) -> None:
+    histogram(name, unit).record(value)
+
+
+def summary() -> List[str]:
+    return [f"{name}: {hist.describe()}" for name, hist in sorted(_histograms.items())]
+
+
+def reset() -> None:
+    with _registry_lock:
+        _histograms.clear()
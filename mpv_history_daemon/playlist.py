@@ -0,0 +1,83 @@
+"""
+Delta-encoded playlists
+
+With daemon --playlist, the full playlist is saved once per session (the
+'playlist' event), and after that only what changed ('playlist-delta'),
+as a list of operations:
+
+    ["insert", index, [filename, ...]]  insert filenames before index
+    ["remove", index, count]            remove count filenames starting at index
+    ["move", from, to]                  move the filename at from, so it ends up at to
+
+playlist_at replays these to get the playlist at any point in a session
+"""
+
+from typing import Any, Dict, List, Optional
+
+Op = List[Any]
+
+
+def playlist_delta(old: List[str], new: List[str]) -> Optional[List[Op]]:
+    """
+    the operations which turn old into new, or None if saving new as
+    a whole would be smaller (e.g. after shuffling the playlist)
+    """
+    # only the part between the common prefix and suffix changed
+    start = 0
+    end = min(len(old), len(new))
+    while start < end and old[start] == new[start]:
+        start += 1
+    old_end, new_end = len(old), len(new)
+    while old_end > start and new_end > start and old[old_end - 1] == new[new_end - 1]:
+        old_end -= 1
+        new_end -= 1
+    removed = old[start:old_end]
+    inserted = new[start:new_end]
+    if not removed and not inserted:
+        return []
+    if not removed:
+        return [["insert", start, inserted]]
+    if not inserted:
+        return [["remove", start, len(removed)]]
+    if len(removed) == len(inserted) > 1:
+        if removed[0] == inserted[-1] and removed[1:] == inserted[:-1]:
+            return [["move", start, old_end - 1]]
+        if removed[-1] == inserted[0] and removed[:-1] == inserted[1:]:
+            return [["move", old_end - 1, start]]
+    if len(inserted) >= len(new) // 2:
+        return None
+    return [["remove", start, len(removed)], ["insert", start, inserted]]
+
+
+def apply_playlist_delta(playlist: List[str], ops: List[Op]) -> List[str]:
+    """
+    returns a new playlist with the operations applied
+    """
+    playlist = list(playlist)
+    for op in ops:
+        kind = op[0]
+        if kind == "insert":
+            playlist[op[1] : op[1]] = op[2]
+        elif kind == "remove":
+            del playlist[op[1] : op[1] + op[2]]
+        elif kind == "move":
+            playlist.insert(op[2], playlist.pop(op[1]))
+        else:
+            raise ValueError(f"Unknown playlist operation {op}")
+    return playlist
+
+
+def playlist_at(events: Dict[Any, Dict[str, Any]], at: float) -> Optional[List[str]]:
+    """
+    the playlist at some timestamp, from the events in an event file
+    (or a session from a merged file). None if no playlist was saved before then
+    """
+    playlist: Optional[List[str]] = None
+    for ts, event in sorted(events.items(), key=lambda kv: float(kv[0])):
+        if float(ts) > at:
+            break
+        if "playlist" in event:
+            playlist = event["playlist"]
+        elif "playlist-delta" in event and playlist is not None:
+            playlist = apply_playlist_delta(playlist, event["playlist-delta"])
+    return playlist
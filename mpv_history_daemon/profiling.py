@@ -0,0 +1,98 @@
+"""
+Per-stage timing for the parse/merge pipelines
+
+When enabled (e.g. with 'mpv-history-daemon --profile parse ...'), the
+pipeline records wall time, CPU time and the number of items processed in
+each stage (reading/decompressing, decoding, reconstructing, filtering,
+encoding). When disabled, stage() returns a shared no-op context manager,
+so this costs next to nothing
+"""
+
+import sys
+import threading
+from contextlib import contextmanager, nullcontext
+from time import perf_counter, thread_time
+from typing import Dict, Iterator, Optional, ContextManager, TextIO, List
+
+
+class StageStats:
+    def __init__(self) -> None:
+        self.calls = 0
+        self.items = 0
+        self.wall = 0.0
+        self.cpu = 0.0
+
+
+class Profiler:
+    def __init__(self) -> None:
+        self.stages: Dict[str, StageStats] = {}
+        self._lock = threading.Lock()
+        self._start = perf_counter()
+
+    def record(
+        self, name: str, wall: float, cpu: float, items: int = 0, calls: int = 1
+    ) -> None:
+        with self._lock:
+            st = self.stages.setdefault(name, StageStats())
+            st.calls += calls
+            st.items += items
+            st.wall += wall
+            st.cpu += cpu
+
+    def count(self, name: str, items: int) -> None:
+        self.record(name, 0.0, 0.0, items, calls=0)
+
+    @contextmanager
+    def stage(self, name: str, items: int = 0) -> Iterator[None]:
+        # thread_time, since stages may run in reader threads
+        wall, cpu = perf_counter(), thread_time()
+        try:
+            yield
+        finally:
+            self.record(name, perf_counter() - wall, thread_time() - cpu, items)
+
+    def summary(self) -> List[str]:
+        total = perf_counter() - self._start
+        lines = [
+            f"{'stage':<16} {'calls':>8} {'items':>10} {'wall':>10} {'cpu':>10} {'% wall':>7}"
+        ]
+        for name, st in self.stages.items():
+            pct = st.wall / total * 100 if total > 0 else 0.0
+            lines.append(
+                f"{name:<16} {st.calls:>8} {st.items:>10} {st.wall:>9.3f}s {st.cpu:>9.3f}s {pct:>6.1f}%"
+            )
+        lines.append(f"{'total':<16} {'':>8} {'':>10} {total:>9.3f}s")
+        return lines
+
+    def print_summary(self, file: TextIO = sys.stderr) -> None:
+        for line in self.summary():
+            print(line, file=file)
+
+
+# the active profiler, if profiling is enabled
+current: Optional[Profiler] = None
+
+_noop: ContextManager[None] = nullcontext()
+
+
+def enable() -> Profiler:
+    global current
+    current = Profiler()
+    return current
+
+
+def stage(name: str, items: int = 0) -> ContextManager[None]:
+    """
+    time a stage of the pipeline, if profiling is enabled
+    """
+    if current is None:
+        return _noop
+    return current.stage(name, items)
+
+
+def count(name: str, items: int) -> None:
+    """
+    add to the number of items processed by a stage
+    """
+    if current is not None:
+        current.count(name, items)
@@ -0,0 +1,102 @@
+"""
+Publishes what the daemon sees as it happens, over a local unix socket
+
+Subscribers (e.g. 'mpv-history-daemon tail', status bars, scrobblers)
+connect to the socket and receive JSON lines:
+
+{"type": "event", "socket_time": "...", "time": 1598957274.33, "event": "path", "data": "..."}
+{"type": "media", "socket_time": "...", "media": {...}}
+
+'event' records are sent as each event is saved by the daemon, 'media'
+records are sent as soon as a file finishes playing (an eof, or mpv quitting),
+reconstructed from the events by events.Reconstructor
+
+Subscribers which can't keep up (whose socket buffer fills up) are
+disconnected, so they can never block the daemon
+"""
+
+import os
+import socket
+import threading
+from tempfile import gettempdir
+from typing import Any, Dict, List, Iterator
+
+import simplejson
+from logzero import logger  # type: ignore[import]
+
+from .serialize import default_encoder
+
+
+def default_publish_path() -> str:
+    runtime_dir = os.environ.get("XDG_RUNTIME_DIR", gettempdir())
+    return os.path.join(runtime_dir, "mpv-history-daemon.sock")
+
+
+class Publisher:
+    def __init__(self, path: str) -> None:
+        self.path = path
+        self._clients: List[socket.socket] = []
+        self._lock = threading.Lock()
+        # left behind by a previous daemon which didn't exit cleanly
+        if os.path.exists(path):
+            os.remove(path)
+        self._server = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+        self._server.bind(path)
+        self._server.listen()
+        threading.Thread(target=self._accept, name="publisher", daemon=True).start()
+        logger.info(f"Publishing events to {path}")
+
+    @property
+    def has_subscribers(self) -> bool:
+        return len(self._clients) > 0
+
+    def _accept(self) -> None:
+        while True:
+            try:
+                conn, _ = self._server.accept()
+            except OSError:
+                # server was closed
+                return
+            conn.setblocking(False)
+            with self._lock:
+                self._clients.append(conn)
+            logger.debug("New subscriber connected")
+
+    def publish(self, record: Dict[str, Any]) -> None:
+        if not self._clients:
+            return
+        line = (
+            simplejson.dumps(record, default=default_encoder, namedtuple_as_object=True)
+            + "\n"
+        ).encode("utf-8")
+        with self._lock:
+            for conn in list(self._clients):
+                try:
+                    conn.sendall(line)
+                except OSError as e:
+                    # BlockingIOError if its not keeping up, BrokenPipeError if it disconnected
+                    logger.debug(f"Disconnecting subscriber: {e!r}")
+                    conn.close()
+                    self._clients.remove(conn)
+
+    def close(self) -> None:
+        self._server.close()
+        with self._lock:
+            for conn in self._clients:
+                conn.close()
+            self._clients.clear()
+        try:
+            os.remove(self.path)
+        except FileNotFoundError:
+            pass
+
+
+def subscribe(path: str) -> Iterator[Dict[str, Any]]:
+    """
+    connect to a running daemon, yielding records as they're published
+    """
+    with socket.socket(socket.AF_UNIX, socket.SOCK_STREAM) as sock:
+        sock.connect(path)
+        with sock.makefile("rb") as f:
+            for line in f:
+                yield simplejson.loads(line)
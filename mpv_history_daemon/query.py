@@ -0,0 +1,208 @@
+"""
+A persistent sqlite index of parsed Media, so that common lookups
+(by time, path, title/artist etc.) don't require re-parsing every
+event file in the data directory
+
+The index tracks the mtime/size of every file it has parsed, so
+updating it only re-parses files which have been added or changed
+"""
+
+import os
+import sqlite3
+from pathlib import Path
+from typing import Sequence, Iterator, Optional, List, Tuple, Any, NamedTuple
+
+import simplejson
+
+from .events import logger, all_history, Media, _actually_listened_to
+from .serialize import default_encoder
+from .utils import music_parse_metadata_from_blob
+
+# bump this whenever the schema or how rows are computed changes,
+# which causes the index to be rebuilt from scratch
+INDEX_VERSION = 1
+
+
+def default_index_path() -> Path:
+    cache_dir = os.environ.get("XDG_CACHE_HOME", os.path.expanduser("~/.cache"))
+    return Path(cache_dir) / "mpv-history-daemon" / "index.sqlite"
+
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS files (
+    name TEXT PRIMARY KEY,
+    mtime REAL NOT NULL,
+    size INTEGER NOT NULL
+);
+CREATE TABLE IF NOT EXISTS media (
+    file TEXT NOT NULL,
+    path TEXT NOT NULL,
+    is_stream INTEGER NOT NULL,
+    start_time REAL NOT NULL,
+    end_time REAL NOT NULL,
+    listen_time REAL NOT NULL,
+    listened INTEGER NOT NULL,
+    media_title TEXT,
+    title TEXT,
+    album TEXT,
+    artist TEXT,
+    data TEXT NOT NULL
+);
+CREATE INDEX IF NOT EXISTS media_file ON media (file);
+CREATE INDEX IF NOT EXISTS media_start_time ON media (start_time);
+CREATE INDEX IF NOT EXISTS media_path ON media (path);
+"""
+
+
+class IndexUpdate(NamedTuple):
+    parsed: List[Path]
+    removed: List[str]
+    unchanged: int
+
+
+def media_to_json(m: Media) -> str:
+    return simplejson.dumps(m, default=default_encoder, namedtuple_as_object=True)
+
+
+def _media_row(file: str, m: Media) -> Tuple[Any, ...]:
+    music = music_parse_metadata_from_blob(m.metadata) if m.metadata else None
+    return (
+        file,
+        m.path,
+        int(m.is_stream),
+        m.start_time.timestamp(),
+        m.end_time.timestamp(),
+        m.listen_time,
+        int(_actually_listened_to(m)),
+        m.media_title,
+        music.title if music else None,
+        music.album if music else None,
+        music.artist if music else None,
+        media_to_json(m),
+    )
+
+
+class HistoryIndex:
+    """
+    Wraps the sqlite database. Call update with the files to index,
+    then query to search the indexed Media
+    """
+
+    def __init__(self, index_file: Path) -> None:
+        self.index_file = index_file
+        index_file.parent.mkdir(parents=True, exist_ok=True)
+        self.conn = sqlite3.connect(str(index_file))
+        version = self.conn.execute("PRAGMA user_version").fetchone()[0]
+        if version != INDEX_VERSION:
+            logger.info(f"Creating new index at {index_file}")
+            self.conn.executescript(
+                "DROP TABLE IF EXISTS files; DROP TABLE IF EXISTS media;"
+            )
+            self.conn.execute(f"PRAGMA user_version = {INDEX_VERSION}")
+        self.conn.executescript(_SCHEMA)
+
+    def close(self) -> None:
+        self.conn.close()
+
+    def __enter__(self) -> "HistoryIndex":
+        return self
+
+    def __exit__(self, *args: Any) -> None:
+        self.close()
+
+    def update(self, files: Sequence[Path]) -> IndexUpdate:
+        """
+        Re-parse any files which are new or have changed since they were last
+        indexed, and remove any indexed files which are no longer in files
+        """
+        known = {
+            name: (mtime, size)
+            for name, mtime, size in self.conn.execute(
+                "SELECT name, mtime, size FROM files"
+            )
+        }
+        parsed: List[Path] = []
+        seen = set()
+        unchanged = 0
+        with self.conn:
+            for f in files:
+                name = str(f)
+                seen.add(name)
+                st = f.stat()
+                if known.get(name) == (st.st_mtime, st.st_size):
+                    unchanged += 1
+                    continue
+                logger.debug(f"Indexing {name}")
+                self.conn.execute("DELETE FROM media WHERE file = ?", (name,))
+                self.conn.executemany(
+                    "INSERT INTO media VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)",
+                    (_media_row(name, m) for m in all_history([f])),
+                )
+                self.conn.execute(
+                    "INSERT OR REPLACE INTO files VALUES (?, ?, ?)",
+                    (name, st.st_mtime, st.st_size),
+                )
+                parsed.append(f)
+            removed = [name for name in known if name not in seen]
+            for name in removed:
+                logger.debug(f"Removing {name} from index")
+                self.conn.execute("DELETE FROM media WHERE file = ?", (name,))
+                self.conn.execute("DELETE FROM files WHERE name = ?", (name,))
+        return IndexUpdate(parsed=parsed, removed=removed, unchanged=unchanged)
+
+    def query(
+        self,
+        *,
+        since: Optional[float] = None,
+        until: Optional[float] = None,
+        path_prefix: Optional[str] = None,
+        title: Optional[str] = None,
+        artist: Optional[str] = None,
+        is_stream: Optional[bool] = None,
+        min_listen_time: Optional[float] = None,
+        all_events: bool = False,
+        reverse: bool = False,
+        limit: Optional[int] = None,
+    ) -> Iterator[str]:
+        """
+        Yields the JSON-serialized Media matching all the given filters,
+        ordered by start_time
+        """
+        where: List[str] = []
+        params: List[Any] = []
+        if since is not None:
+            where.append("start_time >= ?")
+            params.append(since)
+        if until is not None:
+            where.append("start_time < ?")
+            params.append(until)
+        if path_prefix is not None:
+            # range comparison so the path index can be used
+            where.append("path >= ? AND path < ?")
+            params.extend([path_prefix, path_prefix + "\U0010ffff"])
+        if title is not None:
+            # matches either the title tag or the mpv media title
+            where.append(
+                "(instr(lower(title), lower(?)) > 0 OR instr(lower(media_title), lower(?)) > 0)"
+            )
+            params.extend([title, title])
+        if artist is not None:
+            where.append("instr(lower(artist), lower(?)) > 0")
+            params.append(artist)
+        if is_stream is not None:
+            where.append("is_stream = ?")
+            params.append(int(is_stream))
+        if min_listen_time is not None:
+            where.append("listen_time >= ?")
+            params.append(min_listen_time)
+        if not all_events:
+            where.append("listened = 1")
+        sql = "SELECT data FROM media"
+        if where:
+            sql += " WHERE " + " AND ".join(where)
+        sql += " ORDER BY start_time " + ("DESC" if reverse else "ASC")
+        if limit is not None:
+            sql += " LIMIT ?"
+            params.append(limit)
+        for (data,) in self.conn.execute(sql, params):
+            yield data
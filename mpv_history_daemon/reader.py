@@ -0,0 +1,144 @@
+"""
+Reads (and decompresses) event files concurrently
+
+Most of the time spent reading compressed archives is decompression, and
+gzip/lzma/zstd all release the GIL while decompressing, so reading files in
+a thread pool lets that happen on multiple cores while the main thread
+decodes JSON and reconstructs Media
+"""
+
+import os
+import threading
+from time import perf_counter
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor, Future
+from pathlib import Path
+from typing import Sequence, Iterator, Tuple, Dict, Optional, Deque, List
+
+from . import profiling
+from .serialize import read_file_bytes, COMPRESSED_EXTENSIONS
+from .salvage import read_file_bytes_partial
+
+
+def codec_for(path: Path) -> str:
+    """
+    the compression codec for a path, based on its extension, or 'none'
+    """
+    name = path.name
+    if name.endswith(".tar.gz"):
+        return "tar.gz"
+    for ext in COMPRESSED_EXTENSIONS:
+        if name.endswith(ext):
+            return ext.lstrip(".")
+    return "none"
+
+
+class CodecStats:
+    def __init__(self) -> None:
+        self.files = 0
+        self.compressed_bytes = 0
+        self.decompressed_bytes = 0
+        # total time spent in reader threads, summed across threads
+        self.seconds = 0.0
+
+    @property
+    def throughput(self) -> float:
+        """decompressed MB/s per reader thread"""
+        if self.seconds == 0:
+            return 0.0
+        return self.decompressed_bytes / 1e6 / self.seconds
+
+
+class ReadStats:
+    """
+    Keeps track of how much data was read for each codec, and how long it took
+    """
+
+    def __init__(self) -> None:
+        self.codecs: Dict[str, CodecStats] = {}
+        self.wall_seconds = 0.0
+        self._lock = threading.Lock()
+
+    def add(
+        self, codec: str, compressed: int, decompressed: int, seconds: float
+    ) -> None:
+        with self._lock:
+            st = self.codecs.setdefault(codec, CodecStats())
+            st.files += 1
+            st.compressed_bytes += compressed
+            st.decompressed_bytes += decompressed
+            st.seconds += seconds
+
+    def summary(self) -> List[str]:
+        lines = []
+        for codec, st in sorted(self.codecs.items()):
+            lines.append(
+                f"{codec}: {st.files} files, {st.compressed_bytes / 1e6:.2f}MB -> {st.decompressed_bytes / 1e6:.2f}MB, {st.seconds:.3f}s, {st.throughput:.2f}MB/s"
+            )
+        total = sum(st.decompressed_bytes for st in self.codecs.values())
+        if self.wall_seconds > 0:
+            lines.append(
+                f"total: {total / 1e6:.2f}MB in {self.wall_seconds:.3f}s wall, {total / 1e6 / self.wall_seconds:.2f}MB/s"
+            )
+        return lines
+
+
+def _read_one(path: Path, stats: Optional[ReadStats], partial: bool = False) -> bytes:
+    start = perf_counter()
+    with profiling.stage("read"):
+        if partial:
+            data, _ = read_file_bytes_partial(path)
+        else:
+            data = read_file_bytes(path)
+    if stats is not None:
+        try:
+            compressed = os.stat(path).st_size
+        except OSError:
+            compressed = 0
+        stats.add(codec_for(path), compressed, len(data), perf_counter() - start)
+    return data
+
+
+def default_workers() -> int:
+    return min(8, os.cpu_count() or 1)
+
+
+def read_files(
+    paths: Sequence[Path],
+    *,
+    workers: Optional[int] = None,
+    stats: Optional[ReadStats] = None,
+    partial: bool = False,
+) -> Iterator[Tuple[Path, bytes]]:
+    """
+    Yields (path, decompressed bytes) in the same order as paths
+
+    At most 2 * workers files are read ahead of the consumer, so memory
+    stays bounded even if decoding is slower than reading
+
+    If partial is True, errors while reading (e.g. a truncated compressed file)
+    are ignored and whatever could be read is returned
+    """
+    nworkers = workers if workers is not None else default_workers()
+    start = perf_counter()
+    if nworkers <= 1:
+        for p in paths:
+            yield p, _read_one(p, stats, partial)
+    else:
+        with ThreadPoolExecutor(
+            max_workers=nworkers, thread_name_prefix="mpv-history-reader"
+        ) as pool:
+            pending: Deque[Tuple[Path, "Future[bytes]"]] = deque()
+            it = iter(paths)
+            for p in it:
+                pending.append((p, pool.submit(_read_one, p, stats, partial)))
+                if len(pending) >= nworkers * 2:
+                    break
+            while pending:
+                p, fut = pending.popleft()
+                for nxt in it:
+                    pending.append((nxt, pool.submit(_read_one, nxt, stats, partial)))
+                    break
+                yield p, fut.result()
+    if stats is not None:
+        stats.wall_seconds += perf_counter() - start
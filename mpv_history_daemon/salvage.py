@@ -0,0 +1,198 @@
+"""
+Recovers what it can from truncated or corrupted event files
+
+If the computer crashes while the daemon is writing a file, it can be
+left truncated (or full of null bytes). Instead of failing to parse
+the whole file, this decodes one event at a time, keeping every
+complete event up to the point where the data is corrupted
+"""
+
+import os
+import json
+from typing import Any, Dict, Optional, Tuple, NamedTuple, Callable
+
+from .serialize import detect_format, open_file, get_msgpack
+
+
+class SalvageResult(NamedTuple):
+    data: Dict[Any, Any]
+    # number of complete events recovered
+    recovered: int
+    # number of bytes after the last complete event which were dropped
+    dropped_bytes: int
+    # what caused the data to be unparseable, if anything
+    error: Optional[str]
+
+    def describe(self) -> str:
+        return f"recovered {self.recovered} events, dropped {self.dropped_bytes} bytes ({self.error})"
+
+
+def read_file_bytes_partial(file: os.PathLike) -> Tuple[bytes, Optional[str]]:
+    """
+    reads as much of the (possibly compressed) file as possible,
+    a truncated compressed file raises an error part way through
+    """
+    chunks = []
+    error: Optional[str] = None
+    with open_file(file) as f:
+        # read1 returns whatever was decompressed from one underlying read,
+        # so less data is lost when the error happens
+        read = getattr(f, "read1", f.read)
+        while True:
+            try:
+                chunk = read(1 << 16)
+            except Exception as e:
+                error = f"error reading file: {e}"
+                break
+            if not chunk:
+                break
+            chunks.append(chunk)
+    return b"".join(chunks), error
+
+
+class _Truncated(Exception):
+    def __init__(self, msg: str, pos: int) -> None:
+        super().__init__(msg)
+        self.pos = pos
+
+
+_decoder = json.JSONDecoder()
+_WS = " \t\n\r"
+
+
+def _skip_ws(s: str, pos: int) -> int:
+    while pos < len(s) and s[pos] in _WS:
+        pos += 1
+    return pos
+
+
+def _expect(s: str, pos: int, char: str) -> int:
+    pos = _skip_ws(s, pos)
+    if pos >= len(s) or s[pos] != char:
+        raise _Truncated(f"expected {char!r} at position {pos}", pos)
+    return pos + 1
+
+
+def _salvage_json_object(
+    s: str, pos: int, depth: int, counter: Dict[str, int], out: Dict[Any, Any]
+) -> int:
+    """
+    decodes the object starting at pos into out, one key/value at a time
+
+    values are decoded whole, unless depth > 0 and the value is an object,
+    in which case this recurses, so partial objects can be recovered
+    """
+    pos = _expect(s, pos, "{")
+    first = True
+    while True:
+        pos = _skip_ws(s, pos)
+        if pos < len(s) and s[pos] == "}":
+            return pos + 1
+        if not first:
+            pos = _expect(s, pos, ",")
+        first = False
+        pos = _skip_ws(s, pos)
+        try:
+            key, pos = _decoder.raw_decode(s, pos)
+        except json.JSONDecodeError as e:
+            raise _Truncated(f"invalid key: {e.msg}", pos)
+        if not isinstance(key, str):
+            raise _Truncated(f"invalid key at position {pos}", pos)
+        pos = _expect(s, pos, ":")
+        pos = _skip_ws(s, pos)
+        if depth > 0 and pos < len(s) and s[pos] == "{":
+            inner: Dict[Any, Any] = {}
+            out[key] = inner
+            pos = _salvage_json_object(s, pos, depth - 1, counter, inner)
+        else:
+            try:
+                value, pos = _decoder.raw_decode(s, pos)
+            except json.JSONDecodeError as e:
+                raise _Truncated(f"invalid value: {e.msg}", pos)
+            out[key] = value
+            counter["events"] += 1
+
+
+def _depth_for(first_key: Any) -> int:
+    # merged files are {"mapping": {filename: {timestamp: event}}}, so
+    # recurse into those to recover events from a partially written file
+    return 2 if first_key == "mapping" else 0
+
+
+def salvage_json(data: bytes) -> SalvageResult:
+    s = data.decode("utf-8", errors="replace")
+    out: Dict[Any, Any] = {}
+    counter = {"events": 0}
+    start = _skip_ws(s, 0)
+    # peek at the first key to tell if this is a merged file
+    depth = 0
+    try:
+        first_key, _ = _decoder.raw_decode(s, _skip_ws(s, start + 1))
+        depth = _depth_for(first_key)
+    except json.JSONDecodeError:
+        pass
+    try:
+        end = _salvage_json_object(s, start, depth, counter, out)
+    except _Truncated as t:
+        return SalvageResult(
+            data=out,
+            recovered=counter["events"],
+            dropped_bytes=len(s[t.pos :].encode("utf-8", errors="replace")),
+            error=str(t),
+        )
+    return SalvageResult(
+        data=out,
+        recovered=counter["events"],
+        dropped_bytes=len(s[end:].strip().encode("utf-8", errors="replace")),
+        error=None,
+    )
+
+
+def salvage_msgpack(data: bytes) -> SalvageResult:
+    try:
+        msgpack = get_msgpack()
+    except RuntimeError as e:
+        return SalvageResult(
+            data={}, recovered=0, dropped_bytes=len(data), error=str(e)
+        )
+    unpacker = msgpack.Unpacker(raw=False, strict_map_key=False)
+    unpacker.feed(data)
+    out: Dict[Any, Any] = {}
+    counter = {"events": 0}
+    # position after the last complete event
+    good = 0
+
+    def _map(depth: int, target: Dict[Any, Any], first: Callable[[Any], int]) -> None:
+        nonlocal good
+        for i in range(unpacker.read_map_header()):
+            key = unpacker.unpack()
+            d = first(key) if i == 0 and depth < 0 else depth
+            if d > 0:
+                inner: Dict[Any, Any] = {}
+                target[key] = inner
+                _map(d - 1, inner, first)
+            else:
+                target[key] = unpacker.unpack()
+                counter["events"] += 1
+                good = unpacker.tell()
+
+    error: Optional[str] = None
+    try:
+        _map(-1, out, _depth_for)
+    except Exception as e:
+        error = f"{type(e).__name__}: {e}" if str(e) else type(e).__name__
+    return SalvageResult(
+        data=out,
+        recovered=counter["events"],
+        dropped_bytes=len(data) - good,
+        error=error,
+    )
+
+
+def salvage_bytes(data: bytes) -> SalvageResult:
+    """
+    recover as many complete events as possible from a JSON/msgpack event or merged file
+    """
+    if detect_format(data) == "json":
+        return salvage_json(data)
+    return salvage_msgpack(data)
@@ -1,20 +1,57 @@
 import os
 import json
-from typing import Any
+import datetime
+from typing import Any, Union, Literal, Tuple, IO
 
-from kompress import CPath  # type: ignore[import]
+from . import profiling
 
 # try using orjson to speedup load/compact dumped data
 # if its installed, otherwise use default stdlib module
 
+# extensions kompress can decompress
+COMPRESSED_EXTENSIONS: Tuple[str, ...] = (
+    ".zst",
+    ".zstd",
+    ".xz",
+    ".lz4",
+    ".gz",
+    ".zip",
+)
+
+
+def is_compressed(file: Union[str, os.PathLike]) -> bool:
+    return os.fspath(file).endswith(COMPRESSED_EXTENSIONS)
+
+
+def open_file(file: os.PathLike) -> IO[bytes]:
+    """
+    opens the (possibly compressed) file in binary mode
+
+    kompress is slow to import, so its only imported if this is a compressed file
+    """
+    if not is_compressed(file):
+        return open(file, "rb")
+    from kompress import CPath  # type: ignore[import]
+
+    pth = CPath(file) if not isinstance(file, CPath) else file  # type: ignore[no-untyped-call]
+    f: IO[bytes] = pth.open("rb")  # type: ignore[no-untyped-call]
+    return f
+
+
+def read_file_bytes(file: os.PathLike) -> bytes:
+    """
+    reads the (possibly compressed) file, returning the decompressed bytes
+    """
+    with open_file(file) as f:
+        data: bytes = f.read()
+    return data
+
+
 try:
     import orjson  # type: ignore[import]
 
-    def parse_json_file(file: os.PathLike) -> Any:
-        pth = CPath(file) if not isinstance(file, CPath) else file  # type: ignore[no-untyped-call]
-
-        with pth.open() as f:  # type: ignore[no-untyped-call]
-            return orjson.loads(f.read())  # type: ignore[no-untyped-call]
+    def parse_json_bytes(data: Union[bytes, str]) -> Any:
+        return orjson.loads(data)  # type: ignore[no-untyped-call]
 
     def dump_json(data: Any) -> str:
         bdata: bytes = orjson.dumps(data, option=orjson.OPT_NON_STR_KEYS)
@@ -22,13 +59,78 @@ try:
 
 except ImportError:
 
-    def parse_json_file(file: os.PathLike) -> Any:
-        import json
-
-        pth = CPath(file) if not isinstance(file, CPath) else file  # type: ignore[no-untyped-call]
-
-        with pth.open() as f:  # type: ignore[no-untyped-call]
-            return json.load(f)
+    def parse_json_bytes(data: Union[bytes, str]) -> Any:
+        return json.loads(data)
 
     def dump_json(data: Any) -> str:
         return json.dumps(data)
+
+
+def parse_json_file(file: os.PathLike) -> Any:
+    # pass bytes directly to the decoder, skipping decoding to a str first
+    return parse_json_bytes(read_file_bytes(file))
+
+
+# msgpack is a compact binary format, which unlike JSON can
+# keep the float timestamps as keys, instead of converting them to strings
+
+
+DataFormat = Literal["json", "msgpack"]
+DATA_FORMATS: Tuple[DataFormat, ...] = ("json", "msgpack")
+
+FORMAT_EXTENSIONS = {
+    "json": "json",
+    "msgpack": "msgpack",
+}
+
+
+def get_msgpack() -> Any:
+    """
+    imports msgpack, only once it's needed
+    """
+    try:
+        import msgpack  # type: ignore[import]
+    except ImportError:
+        raise RuntimeError(
+            "msgpack is not installed, install it with 'pip install msgpack' to use the msgpack format"
+        )
+    return msgpack
+
+
+def detect_format(data: bytes) -> DataFormat:
+    """
+    all files are a top-level object/map, which for JSON
+    starts with a '{' (possibly after whitespace)
+    """
+    if data.lstrip()[:1] == b"{":
+        return "json"
+    return "msgpack"
+
+
+def parse_data_bytes(data: bytes) -> Any:
+    """
+    parses JSON or msgpack data, detecting which from the data itself
+    """
+    if detect_format(data) == "json":
+        return parse_json_bytes(data)
+    return get_msgpack().unpackb(data, raw=False, strict_map_key=False)
+
+
+def parse_data_file(file: os.PathLike) -> Any:
+    with profiling.stage("read"):
+        data = read_file_bytes(file)
+    with profiling.stage("decode"):
+        return parse_data_bytes(data)
+
+
+def dump_data(data: Any, data_format: DataFormat = "json") -> bytes:
+    if data_format == "json":
+        return dump_json(data).encode("utf-8")
+    bdata: bytes = get_msgpack().packb(data, use_bin_type=True)
+    return bdata
+
+
+def default_encoder(o: Any) -> Any:
+    if isinstance(o, datetime.datetime):
+        return int(o.timestamp())
+    raise TypeError(f"{o} of type {type(o)} is not serializable")
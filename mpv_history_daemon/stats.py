@@ -0,0 +1,282 @@
+"""
+Listening statistics (top artists/albums/titles, listen time per day/week
+and per library root), kept as rollups in a persisted sqlite store
+
+The contribution of each data file to the rollups is saved along with
+the totals, so when files are added, changed or removed, only those files
+are re-parsed and their contributions subtracted from/added to the totals.
+Queries then just read the totals, instead of parsing everything
+"""
+
+import os
+import sqlite3
+from collections import defaultdict
+from pathlib import Path
+from typing import (
+    Sequence,
+    Iterator,
+    Optional,
+    List,
+    Tuple,
+    Any,
+    Dict,
+    NamedTuple,
+)
+from urllib.parse import urlparse
+
+from .events import logger, all_history, Media, _actually_listened_to
+from .query import IndexUpdate
+from .utils import music_parse_metadata_from_blob
+
+# bump this whenever the schema or how rollups are computed changes,
+# which causes the store to be rebuilt from scratch
+STATS_VERSION = 1
+
+# day and week are in UTC, so the rollups don't depend on the local timezone
+# dir is the directory of local files, or the domain for streams
+ROLLUP_KINDS = ("artist", "album", "title", "day", "week", "dir")
+
+# what can be queried, root groups the dir rollups by library directories
+KINDS = ROLLUP_KINDS + ("root",)
+
+# rollups which are sorted chronologically, rather than by listen time
+TIMELINE_KINDS = ("day", "week")
+
+
+def default_stats_path() -> Path:
+    cache_dir = os.environ.get("XDG_CACHE_HOME", os.path.expanduser("~/.cache"))
+    return Path(cache_dir) / "mpv-history-daemon" / "stats.sqlite"
+
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS files (
+    name TEXT PRIMARY KEY,
+    mtime REAL NOT NULL,
+    size INTEGER NOT NULL
+);
+CREATE TABLE IF NOT EXISTS file_rollups (
+    file TEXT NOT NULL,
+    kind TEXT NOT NULL,
+    key TEXT NOT NULL,
+    plays INTEGER NOT NULL,
+    listen_time REAL NOT NULL
+);
+CREATE TABLE IF NOT EXISTS totals (
+    kind TEXT NOT NULL,
+    key TEXT NOT NULL,
+    plays INTEGER NOT NULL,
+    listen_time REAL NOT NULL,
+    PRIMARY KEY (kind, key)
+);
+CREATE INDEX IF NOT EXISTS file_rollups_file ON file_rollups (file);
+CREATE INDEX IF NOT EXISTS totals_listen_time ON totals (kind, listen_time);
+CREATE INDEX IF NOT EXISTS totals_plays ON totals (kind, plays);
+"""
+
+
+class Rollup(NamedTuple):
+    key: str
+    plays: int
+    listen_time: float
+
+
+def _dir_for(m: Media) -> str:
+    if m.is_stream:
+        return urlparse(m.path).netloc or "(stream)"
+    return os.path.dirname(m.path)
+
+
+def _rollup_keys(m: Media) -> Iterator[Tuple[str, str]]:
+    """
+    the (kind, key) pairs a piece of media counts towards
+    """
+    music = music_parse_metadata_from_blob(m.metadata) if m.metadata else None
+    if music is not None:
+        yield "artist", music.artist
+        yield "album", f"{music.artist} - {music.album}"
+        yield "title", f"{music.artist} - {music.title}"
+    elif m.media_title:
+        yield "title", m.media_title
+    iso = m.start_time.isocalendar()
+    yield "day", m.start_time.date().isoformat()
+    yield "week", f"{iso[0]}-W{iso[1]:02d}"
+    yield "dir", _dir_for(m)
+
+
+def file_rollups(media: Sequence[Media]) -> Dict[Tuple[str, str], Tuple[int, float]]:
+    """
+    (kind, key) -> (plays, listen time) for media parsed from one file
+    """
+    acc: Dict[Tuple[str, str], List[float]] = defaultdict(lambda: [0, 0.0])
+    for m in media:
+        # same as the default filter for parse
+        if not _actually_listened_to(m):
+            continue
+        listen_time = m.listen_time
+        for kk in _rollup_keys(m):
+            vals = acc[kk]
+            vals[0] += 1
+            vals[1] += listen_time
+    return {kk: (int(plays), lt) for kk, (plays, lt) in acc.items()}
+
+
+class StatsStore:
+    """
+    Wraps the sqlite database. Call update with the files to include,
+    then top to read the rollups
+    """
+
+    def __init__(self, stats_file: Path) -> None:
+        self.stats_file = stats_file
+        stats_file.parent.mkdir(parents=True, exist_ok=True)
+        self.conn = sqlite3.connect(str(stats_file))
+        version = self.conn.execute("PRAGMA user_version").fetchone()[0]
+        if version != STATS_VERSION:
+            logger.info(f"Creating new stats store at {stats_file}")
+            self.conn.executescript(
+                "DROP TABLE IF EXISTS files; DROP TABLE IF EXISTS file_rollups; DROP TABLE IF EXISTS totals;"
+            )
+            self.conn.execute(f"PRAGMA user_version = {STATS_VERSION}")
+        self.conn.executescript(_SCHEMA)
+
+    def close(self) -> None:
+        self.conn.close()
+
+    def __enter__(self) -> "StatsStore":
+        return self
+
+    def __exit__(self, *args: Any) -> None:
+        self.close()
+
+    def _subtract_file(self, name: str) -> None:
+        self.conn.executemany(
+            "UPDATE totals SET plays = plays - ?, listen_time = listen_time - ? WHERE kind = ? AND key = ?",
+            (
+                (plays, lt, kind, key)
+                for kind, key, plays, lt in self.conn.execute(
+                    "SELECT kind, key, plays, listen_time FROM file_rollups WHERE file = ?",
+                    (name,),
+                ).fetchall()
+            ),
+        )
+        self.conn.execute("DELETE FROM file_rollups WHERE file = ?", (name,))
+
+    def _add_file(self, name: str, media: Sequence[Media]) -> None:
+        rows = [
+            (kind, key, plays, lt)
+            for (kind, key), (plays, lt) in file_rollups(media).items()
+        ]
+        self.conn.executemany(
+            "INSERT INTO file_rollups VALUES (?, ?, ?, ?, ?)",
+            ((name, *row) for row in rows),
+        )
+        self.conn.executemany(
+            "INSERT OR IGNORE INTO totals VALUES (?, ?, 0, 0.0)",
+            ((kind, key) for kind, key, _, _ in rows),
+        )
+        self.conn.executemany(
+            "UPDATE totals SET plays = plays + ?, listen_time = listen_time + ? WHERE kind = ? AND key = ?",
+            ((plays, lt, kind, key) for kind, key, plays, lt in rows),
+        )
+
+    def update(self, files: Sequence[Path]) -> IndexUpdate:
+        """
+        Re-parse any files which are new or have changed since they were last
+        included, and remove any files which are no longer in files, updating
+        the totals with the difference
+        """
+        known = {
+            name: (mtime, size)
+            for name, mtime, size in self.conn.execute(
+                "SELECT name, mtime, size FROM files"
+            )
+        }
+        parsed: List[Path] = []
+        seen = set()
+        unchanged = 0
+        with self.conn:
+            for f in files:
+                name = str(f)
+                seen.add(name)
+                st = f.stat()
+                if known.get(name) == (st.st_mtime, st.st_size):
+                    unchanged += 1
+                    continue
+                logger.debug(f"Computing rollups for {name}")
+                if name in known:
+                    self._subtract_file(name)
+                self._add_file(name, list(all_history([f])))
+                self.conn.execute(
+                    "INSERT OR REPLACE INTO files VALUES (?, ?, ?)",
+                    (name, st.st_mtime, st.st_size),
+                )
+                parsed.append(f)
+            removed = [name for name in known if name not in seen]
+            for name in removed:
+                logger.debug(f"Removing {name} from stats")
+                self._subtract_file(name)
+                self.conn.execute("DELETE FROM files WHERE name = ?", (name,))
+            if parsed or removed:
+                self.conn.execute("DELETE FROM totals WHERE plays <= 0")
+        return IndexUpdate(parsed=parsed, removed=removed, unchanged=unchanged)
+
+    def _roots(self, roots: Sequence[str]) -> List[Rollup]:
+        """
+        sums the dir rollups by which root (library directory) they're in
+        """
+        # longest first, so nested roots match the most specific one
+        by_length = sorted(roots, key=len, reverse=True)
+        acc: Dict[str, List[float]] = defaultdict(lambda: [0, 0.0])
+        for key, plays, lt in self.conn.execute(
+            "SELECT key, plays, listen_time FROM totals WHERE kind = 'dir'"
+        ):
+            # streams are stored by domain
+            root = key if not key.startswith("/") else "(other)"
+            for r in by_length:
+                if key == r or key.startswith(r.rstrip("/") + "/"):
+                    root = r
+                    break
+            vals = acc[root]
+            vals[0] += plays
+            vals[1] += lt
+        return [Rollup(k, int(plays), lt) for k, (plays, lt) in acc.items()]
+
+    def top(
+        self,
+        kind: str,
+        *,
+        sort: Optional[str] = None,
+        limit: Optional[int] = None,
+        roots: Sequence[str] = (),
+    ) -> List[Rollup]:
+        """
+        Rollups of some kind, sorted by 'time' (listen time) or 'plays' (descending),
+        or 'key'. By default, day/week are sorted by key and the rest by listen time
+
+        for the 'root' kind, roots are the library directories to group local files by
+        """
+        if kind not in KINDS:
+            raise ValueError(f"Unknown kind {kind}, expected one of {KINDS}")
+        if sort is None:
+            sort = "key" if kind in TIMELINE_KINDS else "time"
+        if kind == "root":
+            res = self._roots(roots)
+            res.sort(
+                key={
+                    "time": lambda r: -r.listen_time,
+                    "plays": lambda r: -r.plays,
+                    "key": lambda r: r.key,
+                }[sort]
+            )
+            return res[:limit] if limit is not None else res
+        order = {
+            "time": "listen_time DESC",
+            "plays": "plays DESC",
+            "key": "key ASC",
+        }[sort]
+        sql = f"SELECT key, plays, listen_time FROM totals WHERE kind = ? ORDER BY {order}"
+        params: List[Any] = [kind]
+        if limit is not None:
+            sql += " LIMIT ?"
+            params.append(limit)
+        return [Rollup(*row) for row in self.conn.execute(sql, params)]
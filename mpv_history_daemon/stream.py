@@ -0,0 +1,189 @@
+"""
+Streaming decode of merged files
+
+A merged file is {"mapping": {filename: {timestamp: event, ...}, ...}},
+which for years of history can be very large. Instead of reading and
+decoding the whole file at once, this yields one session (the filename
+and its events) at a time, so memory is bounded by the largest session
+rather than the whole archive
+"""
+
+import os
+import json
+import codecs
+from typing import Any, Iterator, Tuple, IO, Optional
+
+from . import profiling
+from .serialize import open_file, get_msgpack, detect_format
+
+# how much to read from the file at a time
+CHUNK_SIZE = 1 << 20
+
+# merged files at least this large (on disk) are streamed by default
+STREAM_THRESHOLD = 32 << 20
+
+Session = Tuple[str, Any]
+
+_decoder = json.JSONDecoder()
+_WS = " \t\n\r"
+
+
+class _JSONReader:
+    """
+    reads JSON tokens/values from a file, keeping only the part of the
+    file which hasn't been decoded yet in memory
+    """
+
+    def __init__(self, f: IO[bytes], chunk_size: int) -> None:
+        self.f = f
+        self.chunk_size = chunk_size
+        self.decoder = codecs.getincrementaldecoder("utf-8")()
+        self.buf = ""
+        self.pos = 0
+        self.eof = False
+
+    def _fill(self, size: int) -> bool:
+        """
+        read more data into the buffer, returns False if at the end of the file
+        """
+        if self.eof:
+            return False
+        with profiling.stage("read"):
+            data = self.f.read(size)
+        self.eof = not data
+        # drop everything which has already been decoded
+        self.buf = self.buf[self.pos :] + self.decoder.decode(data, final=self.eof)
+        self.pos = 0
+        return not self.eof
+
+    def peek(self) -> str:
+        """
+        skips whitespace, returns the next character or an empty string at EOF
+        """
+        while True:
+            while self.pos < len(self.buf) and self.buf[self.pos] in _WS:
+                self.pos += 1
+            if self.pos < len(self.buf):
+                return self.buf[self.pos]
+            if not self._fill(self.chunk_size):
+                return ""
+
+    def expect(self, char: str) -> None:
+        got = self.peek()
+        if got != char:
+            raise ValueError(f"Expected {char!r}, got {got!r}")
+        self.pos += 1
+
+    def value(self) -> Any:
+        """
+        decodes the next complete value (a string or object), reading more
+        of the file until it is all in the buffer
+        """
+        self.peek()
+        size = self.chunk_size
+        while True:
+            try:
+                with profiling.stage("decode"):
+                    val, self.pos = _decoder.raw_decode(self.buf, self.pos)
+                return val
+            except json.JSONDecodeError:
+                if not self._fill(size):
+                    raise
+                # double each time, so large values aren't re-scanned too often
+                size *= 2
+
+
+def _json_sessions(f: IO[bytes], chunk_size: int) -> Optional[Iterator[Session]]:
+    r = _JSONReader(f, chunk_size)
+    r.expect("{")
+    if r.peek() != '"' or r.value() != "mapping":
+        return None
+    r.expect(":")
+    r.expect("{")
+
+    def _sessions() -> Iterator[Session]:
+        first = True
+        while r.peek() != "}":
+            if not first:
+                r.expect(",")
+            first = False
+            name = r.value()
+            r.expect(":")
+            yield name, r.value()
+
+    return _sessions()
+
+
+def _msgpack_sessions(f: IO[bytes], chunk_size: int) -> Optional[Iterator[Session]]:
+    # max_buffer_size=0 is the maximum, instead of the 100MiB default
+    unpacker = get_msgpack().Unpacker(
+        f, raw=False, strict_map_key=False, read_size=chunk_size, max_buffer_size=0
+    )
+    if unpacker.read_map_header() == 0 or unpacker.unpack() != "mapping":
+        return None
+
+    def _sessions() -> Iterator[Session]:
+        for _ in range(unpacker.read_map_header()):
+            name = unpacker.unpack()
+            with profiling.stage("decode"):
+                events = unpacker.unpack()
+            yield name, events
+
+    return _sessions()
+
+
+class _Prefixed:
+    """
+    a file which returns some bytes which were already read from it first
+    """
+
+    def __init__(self, head: bytes, f: IO[bytes]) -> None:
+        self.head = head
+        self.f = f
+
+    def read(self, size: int = -1) -> bytes:
+        if not self.head:
+            return self.f.read(size)
+        if size < 0:
+            data, self.head = self.head + self.f.read(), b""
+        else:
+            data, self.head = self.head[:size], self.head[size:]
+        return data
+
+
+def _open_sessions(f: IO[bytes], chunk_size: int) -> Optional[Iterator[Session]]:
+    """
+    reads up to the start of the mapping, returns None if this isn't a merged file
+    """
+    with profiling.stage("read"):
+        # enough to skip any leading whitespace and detect the format
+        head = f.read(4096)
+    src: Any = _Prefixed(head, f)
+    if detect_format(head) == "json":
+        return _json_sessions(src, chunk_size)
+    return _msgpack_sessions(src, chunk_size)
+
+
+def iter_merged_sessions(
+    file: os.PathLike, chunk_size: int = CHUNK_SIZE
+) -> Iterator[Session]:
+    """
+    yields (filename, events) for each session in a (possibly compressed)
+    JSON/msgpack merged file. Raises a ValueError if this isn't a merged file
+    """
+    with open_file(file) as f:
+        sessions = _open_sessions(f, chunk_size)
+        if sessions is None:
+            raise ValueError(f"{file} is not a merged file")
+        yield from sessions
+
+
+def is_merged_file(file: os.PathLike) -> bool:
+    """
+    checks the start of the file, to tell if its a merged file
+    """
+    try:
+        with open_file(file) as f:
+            return _open_sessions(f, 4096) is not None
+    except Exception:
+        return False
@@ -0,0 +1,204 @@
+"""
+Keeps a parse output file up to date as the daemon writes event files
+
+The Media parsed from each file are cached (as encoded JSON, along with their
+dedupe keys) with the files mtime/size. When something in the data directory
+changes, only the files which were added or changed are parsed again, and
+the output is rewritten from the cache
+
+Uses watchfiles (inotify) if its installed, otherwise polls the data directory
+"""
+
+import os
+from pathlib import Path
+from time import sleep
+from typing import (
+    Callable,
+    Dict,
+    Iterator,
+    List,
+    NamedTuple,
+    Optional,
+    Sequence,
+    Set,
+    Tuple,
+)
+
+from .events import logger, Media, _dedupe_key
+from .query import IndexUpdate, media_to_json
+
+# how often to check for changes, if watchfiles isn't installed
+POLL_INTERVAL = 2.0
+
+Signature = Tuple[int, int]
+
+
+class _Parsed(NamedTuple):
+    signature: Signature
+    # encoded Media, in the order they were parsed
+    encoded: List[str]
+    # (dedupe key, score) for each of those
+    keys: List[Tuple[int, float]]
+
+
+def _signature(p: Path) -> Signature:
+    st = os.stat(p)
+    return st.st_mtime_ns, st.st_size
+
+
+class HistoryWatcher:
+    """
+    resolve returns the files to parse, parse_file returns the Media in a file
+
+    if dedupe is True, duplicate Media across files are removed like
+    all_history(dedupe=True), using the cached keys
+    """
+
+    def __init__(
+        self,
+        output: Path,
+        *,
+        resolve: Callable[[], Sequence[Path]],
+        parse_file: Callable[[Path], List[Media]],
+        dedupe: bool = False,
+    ) -> None:
+        self.output = output
+        self.resolve = resolve
+        self.parse_file = parse_file
+        self.dedupe = dedupe
+        self._cache: Dict[Path, _Parsed] = {}
+
+    def refresh(self) -> IndexUpdate:
+        """
+        re-parse any files which were added or changed, drop any which were removed
+        """
+        parsed: List[Path] = []
+        unchanged = 0
+        output = os.path.abspath(self.output)
+        files = sorted(p for p in self.resolve() if os.path.abspath(p) != output)
+        for p in files:
+            try:
+                sig = _signature(p)
+            except FileNotFoundError:
+                continue
+            cached = self._cache.get(p)
+            if cached is not None and cached.signature == sig:
+                unchanged += 1
+                continue
+            try:
+                media = self.parse_file(p)
+            except Exception as e:
+                # probably still being written, keep what was there
+                # before, this is retried the next time anything changes
+                logger.warning(f"Could not parse {p}, skipping for now: {e}")
+                continue
+            self._cache[p] = _Parsed(
+                sig,
+                [media_to_json(m) for m in media],
+                [(_dedupe_key(m), m.score) for m in media],
+            )
+            parsed.append(p)
+        existing = set(files)
+        removed = [p for p in self._cache if p not in existing]
+        for p in removed:
+            del self._cache[p]
+        return IndexUpdate(
+            parsed=parsed, removed=[str(p) for p in removed], unchanged=unchanged
+        )
+
+    def _encoded(self) -> Iterator[str]:
+        entries = [self._cache[p] for p in sorted(self._cache)]
+        if not self.dedupe:
+            for entry in entries:
+                yield from entry.encoded
+            return
+        # same as _global_dedupe, keep the best score, the first one on ties
+        best: Dict[int, Tuple[float, int]] = {}
+        i = 0
+        for entry in entries:
+            for key, score in entry.keys:
+                if key not in best or score > best[key][0]:
+                    best[key] = (score, i)
+                i += 1
+        keep = set(pos for _, pos in best.values())
+        i = 0
+        for entry in entries:
+            for enc in entry.encoded:
+                if i in keep:
+                    yield enc
+                i += 1
+
+    def write(self) -> int:
+        """
+        atomically replace the output file, returns how many Media were written
+        """
+        encoded = list(self._encoded())
+        tmp = self.output.with_name(f".{self.output.name}.tmp")
+        with open(tmp, "w") as f:
+            f.write("[")
+            f.write(", ".join(encoded))
+            f.write("]\n")
+        os.replace(tmp, self.output)
+        return len(encoded)
+
+    def update(self) -> Optional[IndexUpdate]:
+        """
+        refresh, and rewrite the output if anything changed. Returns
+        None if nothing changed
+        """
+        res = self.refresh()
+        if not res.parsed and not res.removed and self.output.exists():
+            return None
+        count = self.write()
+        logger.info(
+            f"Wrote {count} media to {self.output} (parsed {len(res.parsed)}, removed {len(res.removed)}, unchanged {res.unchanged})"
+        )
+        return res
+
+
+def _poll_changes(paths: Sequence[Path], interval: float) -> Iterator[None]:
+    def _listing() -> Set[Tuple[str, Signature]]:
+        seen = set()
+        for p in paths:
+            entries = p.iterdir() if p.is_dir() else [p]
+            for f in entries:
+                try:
+                    seen.add((str(f), _signature(f)))
+                except FileNotFoundError:
+                    pass
+        return seen
+
+    last = _listing()
+    while True:
+        sleep(interval)
+        current = _listing()
+        if current != last:
+            last = current
+            yield
+
+
+def watch_changes(
+    paths: Sequence[Path], poll_interval: float = POLL_INTERVAL
+) -> Iterator[None]:
+    """
+    yields whenever something in paths changes, forever
+    """
+    try:
+        from watchfiles import watch  # type: ignore[import]
+    except ImportError:
+        logger.info(
+            f"watchfiles not installed (pip install mpv_history_daemon[watch]), polling every {poll_interval}s"
+        )
+        yield from _poll_changes(paths, poll_interval)
+        return
+    for _ in watch(*paths):
+        yield
+
+
+def watch_history(watcher: HistoryWatcher, paths: Sequence[Path]) -> None:
+    """
+    write the output, then update it whenever paths change
+    """
+    watcher.update()
+    for _ in watch_changes(paths):
+        watcher.update()
@@ -0,0 +1,46 @@
+import sys
+import random
+from pathlib import Path
+from typing import Any, Dict, List, Tuple
+
+import pytest
+
+# the synthetic corpus generator used by the benchmarks
+sys.path.insert(0, str(Path(__file__).parent.parent / "benchmarks"))
+
+from corpus import CorpusConfig, generate_sessions  # noqa: E402
+
+Events = Dict[str, Dict[str, Any]]
+
+
+def _truncated(events: Events, rand: random.Random) -> Events:
+    """
+    the events up to some point in the session, like the file a periodic
+    write (or a crash) leaves behind before mpv exits
+    """
+    keys = list(events)
+    return {k: events[k] for k in keys[: rand.randint(1, len(keys) - 1)]}
+
+
+def _corpus() -> List[Tuple[str, Events]]:
+    sessions: List[Tuple[str, Events]] = []
+    for cfg in (
+        CorpusConfig(sessions=40, max_playlist=8, seed=1),
+        CorpusConfig(sessions=20, max_playlist=8, stream_ratio=0.5, seed=2),
+        CorpusConfig(
+            sessions=20, max_playlist=8, pause_density=0.6, library=30, seed=3
+        ),
+    ):
+        sessions.extend(generate_sessions(cfg).items())
+    rand = random.Random(0)
+    sessions.extend((name, _truncated(events, rand)) for name, events in list(sessions))
+    return sessions
+
+
+CORPUS = _corpus()
+
+
+@pytest.fixture(params=CORPUS, ids=[f"{i}" for i in range(len(CORPUS))])
+def session(request: Any) -> Tuple[str, Events]:
+    name, events = request.param
+    return name, events
@@ -0,0 +1,115 @@
+import random
+from typing import Any, Callable, Dict, List, Tuple
+
+import pytest
+
+from mpv_history_daemon.playlist import (
+    apply_playlist_delta,
+    playlist_at,
+    playlist_delta,
+)
+
+from .conftest import CORPUS
+
+# filenames from the corpus, to build playlists from
+FILENAMES = sorted(
+    {
+        event["path"]
+        for _, events in CORPUS
+        for event in events.values()
+        if "path" in event
+    }
+)
+
+Edit = Callable[[random.Random, List[str]], List[str]]
+
+
+def _insert(rand: random.Random, playlist: List[str]) -> List[str]:
+    i = rand.randint(0, len(playlist))
+    return playlist[:i] + rand.sample(FILENAMES, rand.randint(1, 5)) + playlist[i:]
+
+
+def _remove(rand: random.Random, playlist: List[str]) -> List[str]:
+    i = rand.randrange(len(playlist))
+    return playlist[:i] + playlist[i + rand.randint(1, 3) :]
+
+
+def _move(rand: random.Random, playlist: List[str]) -> List[str]:
+    playlist = list(playlist)
+    playlist.insert(
+        rand.randrange(len(playlist)), playlist.pop(rand.randrange(len(playlist)))
+    )
+    return playlist
+
+
+def _replace(rand: random.Random, playlist: List[str]) -> List[str]:
+    i = rand.randrange(len(playlist))
+    return playlist[:i] + [rand.choice(FILENAMES)] + playlist[i + 1 :]
+
+
+def _shuffle(rand: random.Random, playlist: List[str]) -> List[str]:
+    return rand.sample(playlist, len(playlist))
+
+
+EDITS: Dict[str, Edit] = {
+    "insert": _insert,
+    "remove": _remove,
+    "move": _move,
+    "replace": _replace,
+    "shuffle": _shuffle,
+}
+
+
+def _playlists(seed: int, edits: List[Edit]) -> List[List[str]]:
+    """
+    a playlist, and the playlist after each edit
+    """
+    rand = random.Random(seed)
+    playlists = [rand.sample(FILENAMES, 200)]
+    for _ in range(50):
+        playlist = playlists[-1]
+        playlists.append(
+            rand.choice(edits)(rand, playlist)
+            if len(playlist) > 1
+            else _insert(rand, playlist)
+        )
+    return playlists
+
+
+@pytest.mark.parametrize("edit", list(EDITS))
+def test_delta_reproduces_playlist(edit: str) -> None:
+    playlists = _playlists(0, [EDITS[edit]])
+    for old, new in zip(playlists, playlists[1:]):
+        delta = playlist_delta(old, new)
+        if delta is None:
+            # only when saving the whole playlist is smaller
+            assert edit in ("shuffle", "replace")
+            continue
+        assert apply_playlist_delta(old, delta) == new
+        if edit in ("insert", "remove", "move") and old != new:
+            assert [op[0] for op in delta] == [edit]
+
+
+@pytest.mark.parametrize("seed", range(5))
+def test_playlist_at(seed: int) -> None:
+    playlists = _playlists(seed, list(EDITS.values()))
+    # the events the daemon saves, see SocketData.event_playlist
+    events: Dict[float, Dict[str, Any]] = {0.0: {"socket-added": 0.0}}
+    saved: List[Tuple[float, List[str]]] = []
+    last = None
+    for i, playlist in enumerate(playlists, 1):
+        ts = float(i)
+        delta = None if last is None else playlist_delta(last, playlist)
+        if delta is None:
+            events[ts] = {"playlist": playlist}
+        elif delta:
+            events[ts] = {"playlist-delta": delta}
+        # unrelated events in between
+        events[ts + 0.5] = {"seek": {"percent-pos": 50.0}}
+        last = playlist
+        saved.append((ts, playlist))
+    assert playlist_at(events, 0.5) is None
+    for ts, playlist in saved:
+        assert playlist_at(events, ts) == playlist
+        assert playlist_at(events, ts + 0.5) == playlist
+    assert playlist_at(events, float("inf")) == playlists[-1]
@@ -0,0 +1,53 @@
+import copy
+from typing import Any, Dict, List, Tuple
+
+import pytest
+
+from mpv_history_daemon.events import Reconstructor, _reconstruct_event_stream
+from mpv_history_daemon.serialize import DataFormat, dump_data, parse_data_bytes
+
+from .conftest import Events
+from .legacy_reconstruct import (
+    _reconstruct_event_stream as legacy_reconstruct_event_stream,
+)
+
+
+def _reconstructed(events: Events, name: str) -> List[Dict[str, Any]]:
+    # the reconstructor keeps references to event data, so each gets its own copy
+    return list(
+        _reconstruct_event_stream(copy.deepcopy(events), name, allow_if_playing_for=60)
+    )
+
+
+def test_matches_legacy(session: Tuple[str, Events]) -> None:
+    name, events = session
+    legacy = list(
+        legacy_reconstruct_event_stream(
+            copy.deepcopy(events), name, allow_if_playing_for=60
+        )
+    )
+    assert _reconstructed(events, name) == legacy
+
+
+@pytest.mark.parametrize("data_format", ["json", "msgpack"])
+def test_state_round_trip(session: Tuple[str, Events], data_format: DataFormat) -> None:
+    if data_format == "msgpack":
+        pytest.importorskip("msgpack")
+    name, events = session
+    expected = _reconstructed(events, name)
+    timestamps = sorted(events, key=float)
+    # a few points in the session, including before the first/after the last event
+    for cut in sorted({0, len(timestamps) // 3, len(timestamps) // 2, len(timestamps)}):
+        r = Reconstructor(name, allow_if_playing_for=60)
+        media: List[Dict[str, Any]] = []
+        for ts in timestamps[:cut]:
+            media.extend(r.feed(ts, copy.deepcopy(events[ts])))
+        # like the daemon would if it saved this and was restarted
+        state = parse_data_bytes(dump_data(r.state(), data_format))
+        r = Reconstructor.from_state(state)
+        for ts in timestamps[cut:]:
+            if r.done:
+                break
+            media.extend(r.feed(ts, copy.deepcopy(events[ts])))
+        media.extend(r.finish())
+        assert media == expected, f"differs after restoring at event {cut}"
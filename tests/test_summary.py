@@ -0,0 +1,74 @@
+from pathlib import Path
+from typing import Any, Dict, List, Tuple
+
+import pytest
+
+from mpv_history_daemon.events import (
+    Media,
+    summarize,
+    _parse_history_file,
+    _summarized_media,
+)
+from mpv_history_daemon.serialize import (
+    DataFormat,
+    FORMAT_EXTENSIONS,
+    dump_data,
+    parse_data_bytes,
+)
+
+from .conftest import Events
+
+
+def _daemon_events(events: Events) -> Dict[float, Dict[str, Any]]:
+    # the daemon has float timestamps in memory, JSON turns them into strings
+    return {float(ts): event for ts, event in events.items()}
+
+
+def _parse(
+    tmp_path: Path, name: str, events: Any, data_format: DataFormat, merged: bool
+) -> List[Media]:
+    tmp_path.mkdir(exist_ok=True)
+    if merged:
+        p = tmp_path / f"merged.{FORMAT_EXTENSIONS[data_format]}"
+        p.write_bytes(dump_data({"mapping": {name: events}}, data_format))
+    else:
+        p = tmp_path / f"{name.split('.')[0]}.{FORMAT_EXTENSIONS[data_format]}"
+        p.write_bytes(dump_data(events, data_format))
+    return list(_parse_history_file(p))
+
+
+@pytest.mark.parametrize("merged", [False, True], ids=["event-file", "merged"])
+@pytest.mark.parametrize("data_format", ["json", "msgpack"])
+def test_summary_matches_reconstruction(
+    tmp_path: Path,
+    session: Tuple[str, Events],
+    data_format: DataFormat,
+    merged: bool,
+) -> None:
+    if data_format == "msgpack":
+        pytest.importorskip("msgpack")
+    name, events = session
+    reconstructed = _parse(
+        tmp_path / "events", name, _daemon_events(events), data_format, merged
+    )
+
+    # like SocketData.store_summary
+    summarized = _daemon_events(events)
+    summary = summarize(summarized, name)
+    summarized[max(summarized) + 0.001] = {"summary": summary}
+    decoded = parse_data_bytes(dump_data(summarized, data_format))
+    assert _summarized_media(decoded, allow_if_playing_for=60) is not None
+    assert len(summary["media"]) == len(reconstructed)
+
+    assert (
+        _parse(tmp_path / "summary", name, summarized, data_format, merged)
+        == reconstructed
+    )
+
+
+def test_summary_ignored_after_new_events(session: Tuple[str, Events]) -> None:
+    name, events = session
+    summarized = _daemon_events(events)
+    summarized[max(summarized) + 0.001] = {"summary": summarize(summarized, name)}
+    summarized[max(summarized) + 0.001] = {"eof": None}
+    assert _summarized_media(summarized, allow_if_playing_for=60) is None